@@ -30,6 +30,9 @@ use urpm::util qw();
 use URPM;
 
 
+## Version of the backend response protocol, see pkg_ref():
+our $PROTOCOL_VERSION = 2;
+
 ##
 # compute_orphans
 #     Compute from a $state object the orphans to remove and add them
@@ -154,41 +157,45 @@ sub pkg_from_fullname {
 }
 
 ##
-# create_pkg_arg
-#     Return both na and evrd in a string as a python tuple, to be
-#     used in reponses.
+# pkg_ref
+#     Return the id referencing a package in responses.  The first
+#     time a package is seen $define is called with the id and the
+#     package fields (name, arch, epoch, version, release and
+#     distepoch), so the package definition can be emitted before it
+#     is referenced.
+# :Parameters:
+#     `$pkg` : URPM::Package
+#         The package to reference
+#     `$define` : code_ref
+#         Called to emit the package definition
 #
-sub create_pkg_arg {
-    my $pkg = shift;
+my %pkg_ids = ();
+my $next_pkg_id = 0;
 
-    my $name = $pkg->name;
-    my $arch = $pkg->arch;
-    $name =~ s/'/\'/g;
-    $arch =~ s/'/\'/g;
-    my $na = sprintf("('%s', '%s')", $name, $arch);
+sub pkg_ref {
+    my ($pkg, $define) = @_;
 
-    my $evrd = sprintf(
-	"{'epoch': %s," .
-	" 'version': '%s'," .
-	" 'release': '%s'",
-	$pkg->epoch,
-	$pkg->version,
-	$pkg->release);
-    if ($pkg->distepoch) {
-	$evrd .= sprintf(", 'distepoch': '%s'}",
-			 $pkg->distepoch);
+    my @fields = ($pkg->name,
+		  $pkg->arch,
+		  $pkg->epoch || 0,
+		  $pkg->version,
+		  $pkg->release,
+		  $pkg->distepoch || '');
+    my $key = join("\t", @fields);
+    my $id = $pkg_ids{$key};
+    if (not defined $id) {
+	$id = $next_pkg_id++;
+	$pkg_ids{$key} = $id;
+	$define->($id, @fields);
     }
-    else {
-	$evrd .= '}'
-    }
-
-    return '(' . join(', ', $na, $evrd) . ')';
+    return $id;
 }
 
 ##
 # create_pkg_map
 #   Return a map of relevant fullnames in $state object to
-#   package arguments to be used in backend responses.
+#   package references to be used in backend responses, $define is
+#   passed to pkg_ref().
 #
 #   Currently the fullnames mapped are from:
 #     - {rejected},
@@ -199,6 +206,7 @@ sub create_pkg_arg {
 sub create_pkg_map {
     my $urpm = shift;
     my $state = shift;
+    my $define = shift;
 
     my %fullnames = ();
     my %fullnames_mark = ();
@@ -212,7 +220,7 @@ sub create_pkg_map {
     my $set_fullname = sub {
 	my $pkg = shift;
 	if (exists $fullnames{$pkg->fullname}) {
-	    my $pkg_arg = create_pkg_arg($pkg);
+	    my $pkg_arg = pkg_ref($pkg, $define);
 	    $fullnames{$pkg->fullname} = $pkg_arg;
 	    my $nvra = sprintf("%s-%s-%s.%s",
 			       $pkg->name,
@@ -41,23 +41,88 @@ use mdvpkg;
 
 $| = 1;
 
-binmode STDOUT, ':encoding(utf8)';
+# Responses are line framed, they're written to a copy of STDOUT and
+# anything else printed by urpm goes to STDERR, so it can't be glued to
+# a response ...
+open(my $RESPONSE, '>&', \*STDOUT) or die "can't dup STDOUT: $!\n";
+open(STDOUT, '>&', \*STDERR) or die "can't redirect STDOUT: $!\n";
+select((select($RESPONSE), $| = 1)[0]);
+
+binmode $RESPONSE, ':encoding(utf8)';
+binmode STDERR, ':encoding(utf8)';
 binmode STDIN, ':encoding(utf8)';
 
 MAIN: {
-    my $task_string;
-    if (not defined($task_string = <>)) {
-	print "%MDVPKG ERROR Missing task string\n";
-	exit 1;
+    # In server mode requests are read until EOF, otherwise a single
+    # task string is resolved ...
+    my $server = @ARGV && $ARGV[0] eq '--server' && shift @ARGV;
+
+    my $urpm = urpm_init();
+
+    print $RESPONSE "%MDVPKG PROTOCOL\t$mdvpkg::PROTOCOL_VERSION\n";
+
+    if (not $server) {
+	my $task_string;
+	if (not defined($task_string = <STDIN>)) {
+	    print $RESPONSE "%MDVPKG ERROR Missing task string\n";
+	    exit 1;
+	}
+	chomp($task_string);
+	resolve($urpm, split(/\t/, $task_string));
+	exit 0;
+    }
+
+    # Each request is a line with a command and its tab separated
+    # arguments, the responses for a request are always terminated by
+    # a DONE line ...
+    while (defined(my $request = <STDIN>)) {
+	chomp($request);
+	my ($command, @names) = split(/\t/, $request);
+	$command ||= '';
+	if ($command eq 'resolve') {
+	    eval {
+		resolve($urpm, @names);
+		1;
+	    }
+	    or do {
+		my $error = ref($@) ? $@->{error} : $@;
+		chomp($error);
+		response_error('error-exception', $error);
+	    };
+	}
+	elsif ($command eq 'reload') {
+	    $urpm = urpm_init();
+	}
+	else {
+	    response_error('error-unknown-command', $command);
+	}
+	print $RESPONSE "%MDVPKG DONE\n";
     }
-    chomp($task_string);
-    my (@names) = split(/\t/, $task_string);
+    exit 0;
+}
 
-    # Initializing urpmi ...
+##
+# urpm_init
+#     Create the urpm object and configure its medias.
+#
+sub urpm_init {
     my $urpm = urpm->new_parse_cmdline;
-    $urpm->{debug} = sub { print "[debug] @_\n" };
-    $urpm->{debug_URPM} = sub { print "[debug_URPM] @_\n" };
+    $urpm->{debug} = sub { print STDERR "[debug] @_\n" };
+    $urpm->{debug_URPM} = sub { print STDERR "[debug_URPM] @_\n" };
     urpm::media::configure($urpm);
+    return $urpm;
+}
+
+##
+# resolve
+#     Resolve the selection of names and emit responses.
+# :Parameters:
+#     `$urpm` : The urpm object
+#     `@names` : list
+#         Fullnames to install, or to remove if prefixed by 'r:'
+#
+sub resolve {
+    my ($urpm, @names) = @_;
 
     # Parse args ...
     my $installs = [];
@@ -78,10 +143,12 @@ MAIN: {
     }
     or do {
 	response_error($@->{error}, @{ $@->{names} });
-	exit 0;
+	return;
     };
 
-    my $pkg_map = mdvpkg::create_pkg_map($urpm, $state);
+    my $pkg_map = mdvpkg::create_pkg_map($urpm,
+					  $state,
+					  \&response_pkg);
 
     # Check %state and emit return data ...
     CHECK_UNSELECTED: {
@@ -120,8 +187,8 @@ MAIN: {
 	    #      here from urpmi, and don't provide responses ...
 
 	    if ($backtrack->{promote} && !$backtrack->{keep}) {
-		print "trying to promote", join(", ",
-						@{$backtrack->{promote}});
+		print STDERR "trying to promote ",
+			     join(", ", @{$backtrack->{promote}}), "\n";
 	    }
 
             my $closure = $state->{rejected}{$fullname}{closure};
@@ -219,7 +286,15 @@ MAIN: {
 
     # TODO There is no conflict checking !!
 
-    exit 0;
+    # Unselect packages, so the next request starts from a clean
+    # depslist ...
+    eval {
+	$urpm->disable_selected(
+	    URPM::DB::open(),
+	    $state,
+	    map { $urpm->{depslist}[$_] } keys %{ $state->{selected} || {} }
+	);
+    };
 }
 
 sub response_reject {
@@ -229,20 +304,25 @@ sub response_reject {
 		    $reason,
 		    $pkg_arg,
 		    @args);
-    printf("%%MDVPKG %s\n", $args);
+    printf $RESPONSE "%%MDVPKG %s\n", $args;
 }
 
 sub response_action {
     my ($action, $pkg) = @_;
-    printf("%%MDVPKG SELECTED\t%s\t%s\n",
+    my $pkg_arg = mdvpkg::pkg_ref($pkg, \&response_pkg);
+    printf $RESPONSE "%%MDVPKG SELECTED\t%s\t%s\n",
 	   $action,
-	   mdvpkg::create_pkg_arg($pkg));
+	   $pkg_arg;
+}
+
+sub response_pkg {
+    printf $RESPONSE "%%MDVPKG PKG\t%s\n", join("\t", @_);
 }
 
 sub response_error {
     my ($name, @args) = @_;
-	printf("%%MDVPKG ERROR\t%s%s\n",
+	printf $RESPONSE "%%MDVPKG ERROR\t%s%s\n",
 	       $name,
-	       @args ? ' ' . join("\t", @args) : '');
+	       @args ? ' ' . join("\t", @args) : '';
 
 }
@@ -57,6 +57,8 @@ our $urpmdb_lock;
 
 
 MAIN: {
+    response('protocol', $mdvpkg::PROTOCOL_VERSION);
+
     # Initializing urpmi ...
     my $urpm = urpm->new_parse_cmdline;
     urpm::media::configure($urpm);
@@ -85,7 +87,21 @@ MAIN: {
 #
 
 sub response {
-    printf("<mdvpkg> %s\n", join("\t", @_));
+    # Tabs and newlines are the response separators, so they're not
+    # allowed in arguments ...
+    my @args = map { (my $arg = defined $_ ? $_ : '') =~ s/[\t\n]/ /g;
+		     $arg } @_;
+    printf("<mdvpkg> %s\n", join("\t", @args));
+}
+
+##
+# pkg_arg
+#     Return the reference to a package to be used as argument in
+#     responses, emitting its definition if needed.
+#
+sub pkg_arg {
+    my $pkg = shift;
+    return mdvpkg::pkg_ref($pkg, sub { response('pkg', @_) });
 }
 
 my ($progress_count, $progress_total);
@@ -190,12 +206,12 @@ sub on_task__commit {
                 my @return = split(/ /, $_[0]);
                 my $pkg = $pkg_map{$return[-1]};
                 response('callback', 'remove_start',
-			 mdvpkg::create_pkg_arg($pkg),
+			 pkg_arg($pkg),
                          100, $remove_count);
                 response('callback', 'remove_progress',
-                         mdvpkg::create_pkg_arg($pkg), 100, 100);
+                         pkg_arg($pkg), 100, 100);
                 response('callback', 'remove_end',
-                         mdvpkg::create_pkg_arg($pkg));
+                         pkg_arg($pkg));
                 progress(1);
             }
         );
@@ -236,23 +252,23 @@ sub on_task__commit {
 		    if ($mode eq 'start') {
 			response('callback',
 				 'download_start',
-				 mdvpkg::create_pkg_arg($pkg));
+				 pkg_arg($pkg));
 		    }
 		    elsif ($mode eq 'progress') {
 			response('callback',
 				 'download_progress',
-				 mdvpkg::create_pkg_arg($pkg),
+				 pkg_arg($pkg),
 				 $percent, $total, $eta, $speed);
 		    }
 		    elsif ($mode eq 'end') {
 			response('callback', 'download_end',
-				 mdvpkg::create_pkg_arg($pkg));
+				 pkg_arg($pkg));
 			progress(1);
 		    }
 		    elsif ($mode eq 'error') {
 			# error message is the 3rd argument, $percent:
 			response('callback', 'download_error',
-				 mdvpkg::create_pkg_arg($pkg), $percent);
+				 pkg_arg($pkg), $percent);
 		    }
 		    else {
 			die "trans_log callback with unknown mode: $mode\n";
@@ -270,20 +286,20 @@ sub on_task__commit {
 		    if ($subtype eq 'progress') {
 			response('callback',
 				 'install_progress',
-				 mdvpkg::create_pkg_arg($pkg),
+				 pkg_arg($pkg),
 				 $amount,
 				 $total);
 			if ($amount ==  $total) {
 			    response('callback',
 				     'install_end',
-				     mdvpkg::create_pkg_arg($pkg));
+				     pkg_arg($pkg));
 			    progress(1);
 			}
 		    }
 		    elsif ($subtype eq 'start') {
 			$task_info{progress} += 1;
 			response('callback', 'install_start',
-				 mdvpkg::create_pkg_arg($pkg),
+				 pkg_arg($pkg),
 				 $total,
 				 $task_info{progress});
 		    }
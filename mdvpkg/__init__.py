@@ -24,6 +24,11 @@
 __author__  = "J. Victor Martins <jvdm@mandriva.com>"
 __version__ = "0.8.1"
 
+
+import weakref
+import itertools
+
+
 SERVICE = 'org.mandrivalinux.MdvPkg'
 IFACE = 'org.mandrivalinux.MdvPkg'
 PATH = '/'
@@ -39,34 +44,77 @@ DEFAULT_DATA_DIR = '%s/mdvpkg' % MANDRIVA_DATA_DIR
 DEFAULT_BACKEND_DIR = '%s/backend' % DEFAULT_DATA_DIR
 
 
+class _WeakMethod(object):
+    """Weak reference to a bound method, calling it returns the bound
+    method or None if its object was collected.
+    """
+
+    def __init__(self, method, callback=None):
+        self._self = weakref.ref(method.im_self, callback)
+        self._func = method.im_func
+
+    def __call__(self):
+        obj = self._self()
+        if obj is None:
+            return None
+        return self._func.__get__(obj, type(obj))
+
+
+def _callback_ref(callback, on_collected):
+    """Return a reference to callback, weak if it's a bound method."""
+    if getattr(callback, 'im_self', None) is not None:
+        return _WeakMethod(callback, on_collected)
+    return lambda: callback
+
+
 class ConnectableObject(object):
-    """A object that can emit signals and call callbacks."""
+    """A object that can emit signals and call callbacks.
+
+    Bound methods are connected by weak reference, they're
+    disconnected when their object is collected.
+    """
 
     def __init__(self, signals=None):
+        # { signal name: tuple of (handler, callback reference) }
         self.__signals = {}
-        self.__signals_callbacks = {}
+        self.__handlers = {}  # { handler: signal name }
+        self.__handler_ids = itertools.count(1)
         if signals is not None:
             for signal_name in signals:
-                self.__signals[signal_name] = []
+                self.__signals[signal_name] = ()
 
     def connect(self, signal_name, callback):
         """Connect a callback to a signal."""
-        conn_tuple = (signal_name, callback)
-        handler = hash(conn_tuple)
-        self.__signals_callbacks[handler] = conn_tuple
-        self.__get_signal_handlers(signal_name).append(handler)
+        signal_handlers = self.__get_signal_handlers(signal_name)
+        handler = next(self.__handler_ids)
+        ref = _callback_ref(callback,
+                            self.__collected_callback(handler))
+        self.__signals[signal_name] = signal_handlers + ((handler, ref),)
+        self.__handlers[handler] = signal_name
         return handler
 
     def disconnect(self, handler):
         """Disconnect a signal callback."""
-        s_name, _ = self.__signals_callbacks.pop(handler)
-        self.__signals[s_name].remove(handler)
+        s_name = self.__handlers.pop(handler)
+        self.__signals[s_name] = tuple(conn for conn
+                                           in self.__signals[s_name]
+                                           if conn[0] != handler)
 
     def emit(self, signal_name, *args):
         """Emit a signal calling all callbacks."""
-        for handler in self.__get_signal_handlers(signal_name):
-            _, callback = self.__signals_callbacks[handler]
-            callback(*args)
+        for _, ref in self.__get_signal_handlers(signal_name):
+            callback = ref()
+            if callback is not None:
+                callback(*args)
+
+    def __collected_callback(self, handler):
+        """Return a weakref callback disconnecting handler."""
+        self_ref = weakref.ref(self)
+        def on_collected(ref):
+            obj = self_ref()
+            if obj is not None and handler in obj.__handlers:
+                obj.disconnect(handler)
+        return on_collected
 
     def __get_signal_handlers(self, signal_name):
         signal_handlers = self.__signals.get(signal_name)
@@ -27,18 +27,21 @@ import logging.handlers
 import sys
 import dbus
 import dbus.exceptions
+import dbus.lowlevel
 import dbus.mainloop.glib
 import dbus.service
 import gobject
 import signal
 import uuid
+import operator
 
 import mdvpkg
 from mdvpkg.urpmi.db import UrpmiDB
 from mdvpkg.urpmi.db import PackageList
 import mdvpkg.tasks
 import mdvpkg.worker
-from mdvpkg.policykit import check_authorization
+import mdvpkg.exceptions
+from mdvpkg.policykit import Authority
 
 
 log = logging.getLogger('mdvpkgd')
@@ -46,11 +49,45 @@ log = logging.getLogger('mdvpkgd')
 dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
 
 
+def directed_signal(dbus_interface, signature):
+    """Decorator like dbus.service.signal(), but sending the signal
+    only to the unique name in the object _sender attribute.
+
+    The signal is broadcast if _sender is None.
+    """
+    def decorator(func):
+        broadcast = dbus.service.signal(dbus_interface=dbus_interface,
+                                        signature=signature)(func)
+
+        def emit(self, *args):
+            if self._sender is None:
+                return broadcast(self, *args)
+            func(self, *args)
+            message = dbus.lowlevel.SignalMessage(
+                          self.__dbus_object_path__,
+                          dbus_interface,
+                          func.__name__
+                      )
+            message.set_destination(self._sender)
+            message.append(signature=signature, *args)
+            self.connection.send_message(message)
+
+        # keep attributes used by dbus.service.Object for
+        # introspection:
+        emit.__dict__.update(broadcast.__dict__)
+        emit.__name__ = func.__name__
+        emit.__doc__ = func.__doc__
+        return emit
+    return decorator
+
+
 class MdvPkgDaemon(dbus.service.Object):
     """Represents the daemon, which provides the dbus interface (by
     default at the system bus)."""
 
-    def __init__(self, bus=None, backend_dir=None):
+    def __init__(self, bus=None, backend_dir=None, load_workers=1,
+                 catalog='objects', progress_rate=10,
+                 resolve_cache_size=64):
         log.info('starting daemon')
 
         signal.signal(signal.SIGQUIT, self._quit_handler)
@@ -71,16 +108,26 @@ class MdvPkgDaemon(dbus.service.Object):
                          mdvpkg.SERVICE)
             sys.exit(1)
         dbus.service.Object.__init__(self, bus_name, mdvpkg.PATH)
-
-        self.urpmi = UrpmiDB(backend_dir=backend_dir)
+        # policykit authorizations, shared by all lists:
+        self.authority = Authority()
+
+        self.urpmi = UrpmiDB(backend_dir=backend_dir,
+                             load_workers=load_workers,
+                             catalog=catalog,
+                             progress_rate=progress_rate,
+                             resolve_cache_size=resolve_cache_size)
         self.urpmi.connect('task-queued', self.TaskQueued)
         self.urpmi.connect('task-running', self.TaskRunning)
         self.urpmi.connect('task-progress', self.TaskProgress)
         self.urpmi.connect('task-done', self.TaskDone)
-        self.urpmi.configure_medias()
-        self.urpmi.load_packages()
+        self.urpmi.connect('loading-progress', self.LoadingProgress)
+        self.urpmi.connect('loaded', self._on_loaded)
+        self.urpmi.connect('load-error', self._on_load_error)
+        # GetList() replies waiting for the package cache ...
+        self._pending_lists = []
+        self.urpmi.load_packages_async()
 
-        log.info('daemon is ready')
+        log.info('daemon is loading packages')
 
     def run(self):
         try:
@@ -98,6 +145,18 @@ class MdvPkgDaemon(dbus.service.Object):
         """A media found during media listing."""
         log.debug('Media(%s, %s, %s)', media_name, update, ignore)
 
+    #
+    # Loading related signals
+    #
+
+    @dbus.service.signal(dbus_interface=mdvpkg.IFACE,
+                         signature='suu')
+    def LoadingProgress(self, stage, count, total):
+        """A stage of the package cache loading (the rpmdb or a
+        media) has finished.
+        """
+        log.debug('LoadingProgress(%s, %s, %s)', stage, count, total)
+
     #
     # Task related signals
     # 
@@ -126,14 +185,32 @@ class MdvPkgDaemon(dbus.service.Object):
     # Daemon methods
     #
 
+    @dbus.service.method(mdvpkg.IFACE,
+                         in_signature='',
+                         out_signature='b')
+    def IsReady(self):
+        """True if the package cache is loaded."""
+        log.debug('IsReady() called')
+        return self.urpmi.ready
+
     @dbus.service.method(mdvpkg.IFACE,
                          in_signature='',
                          out_signature='o',
-                         sender_keyword='sender')
-    def GetList(self, sender):
+                         sender_keyword='sender',
+                         async_callbacks=('reply_handler',
+                                          'error_handler'))
+    def GetList(self, sender, reply_handler, error_handler):
+        """Create a package list, the reply is delayed until the
+        package cache is loaded.
+        """
         log.info('GetList() called')
-        list = DBusPackageList(self.urpmi, sender, self.bus)
-        return list.path
+        if self.urpmi.ready:
+            self._reply_list(sender, reply_handler, error_handler)
+        else:
+            log.debug('package cache not loaded, delaying GetList()')
+            self._pending_lists.append((sender,
+                                        reply_handler,
+                                        error_handler))
 
     @dbus.service.method(mdvpkg.IFACE,
                          in_signature='',
@@ -149,11 +226,32 @@ class MdvPkgDaemon(dbus.service.Object):
         """Handler for quiting signals."""
         self.Quit(None)
 
+    def _reply_list(self, sender, reply_handler, error_handler):
+        try:
+            list = DBusPackageList(self.urpmi, sender, self.authority,
+                                   self.bus)
+        except Exception as e:
+            error_handler(e)
+        else:
+            reply_handler(list.path)
+
+    def _on_loaded(self):
+        log.info('daemon is ready')
+        while self._pending_lists:
+            self._reply_list(*self._pending_lists.pop(0))
+
+    def _on_load_error(self, message):
+        log.critical('could not load package cache: %s', message)
+        while self._pending_lists:
+            _, _, error_handler = self._pending_lists.pop(0)
+            error_handler(mdvpkg.exceptions.MdvPkgError(message))
+        self.Quit(None)
+
 
 class DBusPackageList(PackageList, dbus.service.Object):
     """DBus interface representing a PackageList."""
 
-    def __init__(self, urpmi, sender, bus=None):
+    def __init__(self, urpmi, sender, authority, bus=None):
         if bus is None:
             bus = dbus.SystemBus()
         self._bus = bus
@@ -167,6 +265,7 @@ class DBusPackageList(PackageList, dbus.service.Object):
         )
         PackageList.__init__(self, urpmi)
         self._sender = sender
+        self._authority = authority
         # Watch for sender (which is a unique name) changes:
         self._sender_watch = self._bus.watch_name_owner(
                                  self._sender,
@@ -215,24 +314,39 @@ class DBusPackageList(PackageList, dbus.service.Object):
             raise mdvpkg.exceptions.MdvPkgError(
                       'index out of range: %s' % index
                   )
-        pkg_info = self.get(index)
-        for key in pkg_info.keys():
-            if pkg_info[key] is None:
-                if key == 'progress':
-                    pkg_info[key] = 1.0
-                else:
-                    pkg_info[key] = ''
-        details = {}
-        for attr in attributes:
-            if attr in {'progress'}:
-                details['progress'] = pkg_info[attr]
-            else:
-                value = getattr(pkg_info['rpm'], attr)
-                if value is None:
-                    value = ''
-                details[attr] = value
-        self.Package(index, pkg_info['name'], pkg_info['arch'],
-                     pkg_info['status'], pkg_info['action'], details)
+        package = self._package_struct(index,
+                                       self._details_getter(attributes))
+        self.Package(*package)
+
+    @dbus.service.method(mdvpkg.PACKAGE_LIST_IFACE,
+                         in_signature='uuas',
+                         out_signature='a(ussssa{sv})',
+                         sender_keyword='sender')
+    def GetRange(self, start, count, attributes, sender):
+        """Return the packages from index start up to count packages,
+        with the same values Get() sends in Package signals.
+        """
+        log.debug('GetRange(%s, %s, %s)', start, count, attributes)
+        self._check_owner(sender)
+        if start > len(self):
+            raise mdvpkg.exceptions.MdvPkgError(
+                      'index out of range: %s' % start
+                  )
+        details = self._details_getter(attributes)
+        return [self._package_struct(index, details)
+                for index in xrange(start, min(start + count, len(self)))]
+
+    @dbus.service.method(mdvpkg.PACKAGE_LIST_IFACE,
+                         in_signature='s',
+                         out_signature='au',
+                         sender_keyword='sender')
+    def Search(self, text, sender):
+        """Return the indexes of packages matching text in their names
+        or summaries, best matches first.
+        """
+        log.debug('Search(%s) called', text)
+        self._check_owner(sender)
+        return self.search(text)
 
     @dbus.service.method(mdvpkg.PACKAGE_LIST_IFACE,
                          in_signature='',
@@ -271,26 +385,42 @@ class DBusPackageList(PackageList, dbus.service.Object):
         in_signature='u',
         out_signature='a(ssss)a(ssss)a((ssss)sv)a((ssss)sv)',
         sender_keyword='sender',
-        connection_keyword='connection'
+        connection_keyword='connection',
+        async_callbacks=('reply_handler', 'error_handler')
     )
-    def Install(self, index, sender, connection):
+    def Install(self, index, sender, connection,
+                reply_handler, error_handler):
         """Mark a package and its dependencies for installation."""
         log.debug('Install(%s) called', index)
         self._check_owner(sender)
-        return self._convert_actions(*self.install(index))
+        self.install(index,
+                     self._actions_reply(reply_handler),
+                     error_handler)
 
     @dbus.service.method(
         mdvpkg.PACKAGE_LIST_IFACE,
         in_signature='u',
         out_signature='a(ssss)a(ssss)a((ssss)sv)a((ssss)sv)',
         sender_keyword='sender',
-        connection_keyword='connection'
+        connection_keyword='connection',
+        async_callbacks=('reply_handler', 'error_handler')
     )
-    def Remove(self, index, sender, connection):
+    def Remove(self, index, sender, connection,
+               reply_handler, error_handler):
         """Mark a package and its dependencies for removal."""
         log.debug('Remove(%s) called', index)
         self._check_owner(sender)
-        return self._convert_actions(*self.remove(index))
+        self.remove(index,
+                    self._actions_reply(reply_handler),
+                    error_handler)
+
+    def _actions_reply(self, reply_handler):
+        """Return a resolution handler converting actions for the
+        reply_handler of a method call.
+        """
+        def on_solved(*actions):
+            reply_handler(*self._convert_actions(*actions))
+        return on_solved
 
     def _convert_actions(self, ins_sel, rm_sel, ins_rej, rm_rej):
         ins_sel = map(lambda rpm: rpm.nvra, ins_sel)
@@ -320,84 +450,112 @@ class DBusPackageList(PackageList, dbus.service.Object):
     @dbus.service.method(mdvpkg.PACKAGE_LIST_IFACE,
                          in_signature='u',
                          out_signature='',
-                         sender_keyword='sender')
-    def NoAction(self, index, sender):
+                         sender_keyword='sender',
+                         async_callbacks=('reply_handler',
+                                          'error_handler'))
+    def NoAction(self, index, sender, reply_handler, error_handler):
         """Unmark a package for installation or removal."""
         log.debug('NoAction(%s) called', index)
         self._check_owner(sender)
-        self.no_action(index)
+        self.no_action(index,
+                       lambda *actions: reply_handler(),
+                       error_handler)
 
     @dbus.service.method(mdvpkg.PACKAGE_LIST_IFACE,
                          in_signature='',
                          out_signature='s',
                          sender_keyword='sender',
-                         connection_keyword='connection')
-    def ProcessActions(self, sender, connection):
-	check_authorization(sender,
-                            connection,
-                            'org.mandrivalinux.mdvpkg.auth_admin_keep')
-        try:
-            return self.process_actions()
-        except ValueError:
-            raise mdvpkg.exceptions.MdvPkgError('no action selected')
-        
+                         connection_keyword='connection',
+                         async_callbacks=('reply_handler',
+                                          'error_handler'))
+    def ProcessActions(self, sender, connection,
+                       reply_handler, error_handler):
+        """Run the selected actions once the sender is authorized,
+        replying with the task id.
+        """
+        log.debug('ProcessActions() called')
+
+        def on_authorized():
+            if self._deleted:
+                error_handler(
+                    mdvpkg.exceptions.MdvPkgError('list was deleted')
+                )
+                return
+            try:
+                task_id = self.process_actions()
+            except ValueError:
+                error_handler(
+                    mdvpkg.exceptions.MdvPkgError('no action selected')
+                )
+            except Exception as e:
+                log.exception('failed to process actions')
+                error_handler(e)
+            else:
+                reply_handler(task_id)
+
+        self._authority.check(sender,
+                              connection,
+                              'org.mandrivalinux.mdvpkg.auth_admin_keep',
+                              on_authorized,
+                              error_handler)
+
     #
-    # DBus signals
+    # DBus signals, sent only to the list owner
     #
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='ussssa{sv}')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='ussssa{sv}')
     def Package(self, index, name, arch, status, action, details):
         log.debug('Package(%s, %s, %s, %s, %s) called',
                   index, name, arch, status, action)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='su')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='su')
     def Group(self, group, count):
         log.debug('Group(%s, %s)', group, count)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='')
     def Ready(self):
         log.debug('Ready() called')
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='ss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='ss')
     def Error(self, code, message):
         log.debug('Error(%s, %s) called', code, message)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='sv')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='sv')
     def DownloadStart(self, task_id, index):
         log.debug('DownloadStart(%s) called', index)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='svssss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='svssss')
     def DownloadProgress(self, task_id, index, percent, total, eta, speed):
         log.debug('DownloadProgress(%s, %s) called', index, percent)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='ss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='ss')
     def Preparing(self, task_id, total):
         log.debug('Preparing(%s) called', total)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='svss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='svss')
     def InstallStart(self, task_id, index, total, count):
         log.debug('InstallStart(%s, %s) called', index, total)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='svss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='svss')
     def InstallProgress(self, task_id, index, amount, total):
         log.debug('InstallProgress(%s, %s) called', index, amount)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='svss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='svss')
     def RemoveStart(self, task_id, index, total, count):
         log.debug('RemoveStart(%s) called', index)
 
-    @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
-                         signature='svss')
+    @directed_signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                     signature='svss')
     def RemoveProgress(self, task_id, index, amount, total):
         log.debug('RemoveProgress(%s, %s) called', index, amount)
 
@@ -407,8 +565,6 @@ class DBusPackageList(PackageList, dbus.service.Object):
         self._sender_watch.cancel()
         self.remove_from_connection()
         self.delete()
-        # TODO Disconnect all signals, otherwise the reference will
-        #      persist.
         log.info('package list deleted: %s', self.path)
 
     def _check_owner(self, sender):
@@ -430,23 +586,64 @@ class DBusPackageList(PackageList, dbus.service.Object):
             # mimic the sender deleting the list:
             self.Delete(self._sender)
 
+    def _package_struct(self, index, details):
+        """Return the (index, name, arch, status, action, details)
+        tuple of the package at index, see _details_getter().
+        """
+        pkg_info = self.get(index)
+        for key in pkg_info.keys():
+            if pkg_info[key] is None:
+                if key == 'progress':
+                    pkg_info[key] = 1.0
+                else:
+                    pkg_info[key] = ''
+        return (index, pkg_info['name'], pkg_info['arch'],
+                pkg_info['status'], pkg_info['action'], details(pkg_info))
+
+    def _details_getter(self, attributes):
+        """Return a function building the details dict of a package,
+        with the values of attributes, from the dict returned by get().
+        """
+        rpm_attributes = [attr for attr in attributes
+                               if attr not in {'progress'}]
+        with_progress = len(rpm_attributes) != len(attributes)
+        if len(rpm_attributes) == 1:
+            attrgetter = operator.attrgetter(rpm_attributes[0])
+            get_values = lambda rpm: (attrgetter(rpm),)
+        elif rpm_attributes:
+            get_values = operator.attrgetter(*rpm_attributes)
+        else:
+            get_values = lambda rpm: ()
+
+        def details(pkg_info):
+            values = get_values(pkg_info['rpm'])
+            details = dict((attr, '' if value is None else value)
+                           for attr, value in zip(rpm_attributes, values))
+            if with_progress:
+                details['progress'] = pkg_info['progress']
+            return details
+        return details
+
+    def _package_index(self, package):
+        """Return the index of package in the list, or its nvra if it's
+        filtered out.
+        """
+        index = self.index_of(package.na)
+        if index is None:
+            return package.latest.nvra
+        return index
+
     #
     # Urpmi signal callbacks
     #
 
     def _on_download_start(self, task_id, package):
-        try:
-            index = self._names.index(package.na)
-        except ValueError:
-            index = package.latest.nvra
+        index = self._package_index(package)
         self.DownloadStart(task_id, index)
 
     def _on_download_progress(self, task_id, package, percent,
                               total, eta, speed):
-        try:
-            index = self._names.index(package.na)
-        except ValueError:
-            index = package.latest.nvra
+        index = self._package_index(package)
         self.DownloadProgress(
             task_id, index, percent, total, eta, speed
         )
@@ -455,34 +652,22 @@ class DBusPackageList(PackageList, dbus.service.Object):
         self.Error('download-error', message)
 
     def _on_install_start(self, task_id, package, total, count):
-        try:
-            index = self._names.index(package.na)
-        except ValueError:
-            index = package.latest.nvra
+        index = self._package_index(package)
         self.InstallStart(task_id, index, total, count)
 
     def _on_install_progress(self, task_id, package, amount, total):
-        try:
-            index = self._names.index(package.na)
-        except ValueError:
-            index = package.latest.nvra
+        index = self._package_index(package)
         self.InstallProgress(task_id, index, amount, total)
 
     def _on_preparing(self, task_id, total):
         self.Preparing(task_id, total)
 
     def _on_remove_start(self, task_id, package, total, count):
-        try:
-            index = self._names.index(package.na)
-        except ValueError:
-            index = package.latest.nvra
+        index = self._package_index(package)
         self.RemoveStart(task_id, index, total, count)
 
     def _on_remove_progress(self, task_id, package, amount, total):
-        try:
-            index = self._names.index(package.na)
-        except ValueError:
-            index = package.latest.nvra
+        index = self._package_index(package)
         self.RemoveProgress(task_id, index, amount, total)
 
 def run():
@@ -527,6 +712,38 @@ def run():
                       action='store',
                       dest='backend_dir',
                       help='Path to the urpmi backend directory.')
+    parser.add_option('-j', '--load-workers',
+                      default=1,
+                      type='int',
+                      action='store',
+                      dest='load_workers',
+                      help='Number of processes used to read medias '
+                           'at startup.')
+    parser.add_option('-c', '--catalog',
+                      default='objects',
+                      type='choice',
+                      choices=['objects', 'columnar'],
+                      action='store',
+                      dest='catalog',
+                      help='Package cache store: objects (default) or '
+                           'columnar, which takes less memory for '
+                           'large repositories.')
+    parser.add_option('-r', '--progress-rate',
+                      default=10,
+                      type='int',
+                      action='store',
+                      dest='progress_rate',
+                      help='Maximum number of progress signals sent '
+                           'per second for each package, 0 for no '
+                           'limit.')
+    parser.add_option('-C', '--resolve-cache-size',
+                      default=64,
+                      type='int',
+                      action='store',
+                      dest='resolve_cache_size',
+                      help='Number of dependency resolutions kept in '
+                           'cache, 0 to disable it.  Cache hits and '
+                           'misses are shown with --debug.')
     opts, args = parser.parse_args()
 
     ## Setup daemon and run ...
@@ -539,7 +756,12 @@ def run():
     else:
         log.setLevel(logging.INFO)
 
-    d = MdvPkgDaemon(bus=bus, backend_dir=opts.backend_dir)
+    d = MdvPkgDaemon(bus=bus,
+                     backend_dir=opts.backend_dir,
+                     load_workers=opts.load_workers,
+                     catalog=opts.catalog,
+                     progress_rate=opts.progress_rate,
+                     resolve_cache_size=opts.resolve_cache_size)
     d.run()
 
 
@@ -21,60 +21,150 @@
 ##
 
 
+import time
+import logging
 import dbus
 import dbus.exceptions
 
 from mdvpkg.exceptions import AuthorizationFailed
 
 
-def check_authorization(sender, connection, action):
-    """Check policykit authorization.
+log = logging.getLogger('mdvpkgd.policykit')
 
-    @param sender:
-    @param connection:
-    @param action:
+## Seconds a positive authorization is cached, mdvpkg actions are
+## auth_admin_keep and polkit keeps them for 5 minutes:
+AUTH_KEEP_TTL = 300
 
-    @raise dbus.exceptions.DBusException
+## Seconds the user has to answer an authentication dialog:
+AUTH_TIMEOUT = 600
+
+
+class Authority(object):
+    """Asynchronous policykit authorization checks.
+
+    Positive results are cached by (sender, action) until AUTH_KEEP_TTL
+    or until the sender leaves the bus.  Concurrent checks of the same
+    sender and action share a single policykit call.
     """
 
-    dbus_proxy = connection.get_object(
-        'org.freedesktop.DBus',
-        '/org/freedesktop/DBus/Bus'
-    )
-    dbus_interface = dbus.Interface(
-        dbus_proxy,
-        'org.freedesktop.DBus'
-    )
-
-    pid = dbus_interface.GetConnectionUnixProcessID(sender)
-    bus = dbus.SystemBus()
-
-    policykit_proxy = bus.get_object(
-        'org.freedesktop.PolicyKit1',
-        '/org/freedesktop/PolicyKit1/Authority'
-    )
-
-    policykit_interface = dbus.Interface(
-        policykit_proxy,
-        'org.freedesktop.PolicyKit1.Authority'
-    )
-
-    subject = (
-        'unix-process',
-        { 'pid': dbus.UInt32(pid, variant_level=1),
-          'start-time': dbus.UInt64(0, variant_level=1) }
-    )
-
-    detail = {'': ''}
-    flags = dbus.UInt32(1)
-    cancellation = ''
-    (is_auth, _, details) = policykit_interface.CheckAuthorization(
-                                subject,
-                                action,
-                                detail,
-                                flags,
-                                cancellation,
-                                timeout=600
-                            )
-    if not is_auth:
-        raise AuthorizationFailed
+    def __init__(self, keep_ttl=AUTH_KEEP_TTL):
+        self._keep_ttl = keep_ttl
+        self._proxy = None
+        # { (sender, action): expiration time }
+        self._authorized = {}
+        # { (sender, action): [(reply_handler, error_handler)] }
+        self._pending = {}
+        # { sender: name owner watch }
+        self._watches = {}
+
+    @property
+    def proxy(self):
+        """The policykit Authority interface, created on first use."""
+        if self._proxy is None:
+            proxy = dbus.SystemBus().get_object(
+                        'org.freedesktop.PolicyKit1',
+                        '/org/freedesktop/PolicyKit1/Authority',
+                        introspect=False,
+                        follow_name_owner_changes=True
+                    )
+            self._proxy = dbus.Interface(
+                              proxy,
+                              'org.freedesktop.PolicyKit1.Authority'
+                          )
+        return self._proxy
+
+    def check(self, sender, connection, action,
+              reply_handler, error_handler):
+        """Check if sender, a unique name on connection, is authorized
+        to perform action.
+
+        reply_handler is called with no arguments if it is,
+        error_handler with AuthorizationFailed or the D-Bus error of
+        the check otherwise.
+        """
+        key = (sender, action)
+        expiration = self._authorized.get(key)
+        if expiration is not None:
+            if expiration > time.time():
+                reply_handler()
+                return
+            del self._authorized[key]
+        handlers = self._pending.get(key)
+        if handlers is not None:
+            handlers.append((reply_handler, error_handler))
+            return
+        self._pending[key] = [(reply_handler, error_handler)]
+
+        def on_pid(pid):
+            subject = (
+                'unix-process',
+                { 'pid': dbus.UInt32(pid, variant_level=1),
+                  'start-time': dbus.UInt64(0, variant_level=1) }
+            )
+            detail = {'': ''}
+            # allow user interaction:
+            flags = dbus.UInt32(1)
+            cancellation = ''
+            try:
+                self.proxy.CheckAuthorization(
+                    subject,
+                    action,
+                    detail,
+                    flags,
+                    cancellation,
+                    timeout=AUTH_TIMEOUT,
+                    reply_handler=on_result,
+                    error_handler=on_error
+                )
+            except dbus.exceptions.DBusException as e:
+                on_error(e)
+
+        def on_result(result):
+            is_auth, _, details = result
+            if is_auth:
+                self._keep(connection, key)
+                for reply_handler, _ in self._pending.pop(key, []):
+                    reply_handler()
+            else:
+                on_error(AuthorizationFailed())
+
+        def on_error(error):
+            log.info('authorization of %s for %s failed: %s',
+                     sender, action, error)
+            for _, error_handler in self._pending.pop(key, []):
+                error_handler(error)
+
+        try:
+            bus_proxy = connection.get_object('org.freedesktop.DBus',
+                                              '/org/freedesktop/DBus/Bus',
+                                              introspect=False)
+            dbus.Interface(bus_proxy, 'org.freedesktop.DBus') \
+                .GetConnectionUnixProcessID(sender,
+                                            reply_handler=on_pid,
+                                            error_handler=on_error)
+        except dbus.exceptions.DBusException as e:
+            on_error(e)
+
+    def _keep(self, connection, key):
+        """Cache a positive result until it expires or its sender
+        leaves the bus.
+        """
+        self._authorized[key] = time.time() + self._keep_ttl
+        sender = key[0]
+        if sender not in self._watches:
+            def on_owner_changed(owner):
+                if not owner:
+                    self._forget(sender)
+            self._watches[sender] = connection.watch_name_owner(
+                                        sender,
+                                        on_owner_changed
+                                    )
+
+    def _forget(self, sender):
+        """Drop cached results of a sender."""
+        for key in self._authorized.keys():
+            if key[0] == sender:
+                del self._authorized[key]
+        watch = self._watches.pop(sender, None)
+        if watch is not None:
+            watch.cancel()
@@ -0,0 +1,646 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Package catalogs, the stores of the UrpmiDB package cache.
+
+Catalogs map (name, arch) tuples to package objects, with the Package
+interface, and are filled with RpmPackage objects read from rpmdb and
+medias.
+"""
+
+
+import time
+import array
+import bisect
+import logging
+
+from mdvpkg.urpmi.packages import Package
+from mdvpkg.urpmi.packages import RpmPackage
+from mdvpkg.urpmi.packages import RpmEVRD
+from mdvpkg.urpmi.packages import create_evrd
+from mdvpkg.urpmi.packages import version_key
+
+
+log = logging.getLogger('mdvpkgd.urpmi')
+
+## Codes of PackageView.in_progress values, by position ...
+IN_PROGRESS_CODES = (None, 'installing', 'removing')
+
+## Column values meaning None ...
+NO_STRING = 0
+NO_INSTALLTIME = -1
+NO_PROGRESS = -1.0
+
+
+class PackageCatalog(object):
+    """Catalog keeping a Package object for each (name, arch)."""
+
+    def __init__(self, urpmi):
+        self.urpmi = urpmi
+        self._packages = {}
+
+    def __len__(self):
+        return len(self._packages)
+
+    def __contains__(self, na):
+        return na in self._packages
+
+    def __iter__(self):
+        return iter(self._packages)
+
+    def __getitem__(self, na):
+        return self._packages[na]
+
+    def get(self, na, default=None):
+        return self._packages.get(na, default)
+
+    def itervalues(self):
+        return self._packages.itervalues()
+
+    def add_version(self, rpm):
+        """Add a version read from rpmdb or a media."""
+        self._get_or_create(rpm.na).add_version(rpm)
+
+    def add_installed(self, rpm):
+        """Add a version found installed in rpmdb."""
+        self._get_or_create(rpm.na).add_installed(rpm)
+
+    def remove_installed(self, na, evrd):
+        """Remove a version found removed from rpmdb, dropping the
+        package if no versions are left.
+        """
+        package = self._packages.get(na)
+        if package is None:
+            return
+        package.remove_installed(evrd)
+        if package.is_empty:
+            del self._packages[na]
+
+    def _get_or_create(self, na):
+        package = self._packages.get(na)
+        if package is None:
+            package = Package(na, self.urpmi)
+            self._packages[na] = package
+        return package
+
+
+class StringTable(object):
+    """Map strings to integer ids, with NO_STRING as the id of None."""
+
+    def __init__(self):
+        self._strings = [None]
+        self._ids = {None: NO_STRING}
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __getitem__(self, id):
+        return self._strings[id]
+
+    def id(self, string):
+        """Return the id of string, adding it to the table."""
+        id = self._ids.get(string)
+        if id is None:
+            id = len(self._strings)
+            self._strings.append(string)
+            self._ids[string] = id
+        return id
+
+
+class ColumnarCatalog(object):
+    """Catalog keeping package versions in parallel columns indexed by
+    integer version ids, with low cardinality fields stored as string
+    ids.  Packages are returned as PackageView objects over them.
+
+    Version rows are only appended, versions removed from packages
+    keep their rows until the catalog is recreated.
+    """
+
+    def __init__(self, urpmi):
+        self.urpmi = urpmi
+        self._strings = StringTable()
+        self._string_keys = {}  # version_key() of string ids
+        ## Package columns, indexed by package ids ...
+        self._package_ids = {}  # { na: package id }
+        self._nas = []
+        self._versions = []  # tuples of version ids sorted by evrd
+        self._in_progress = array.array('b')
+        self._progress = array.array('d')
+        ## Version columns, indexed by version ids ...
+        self._package = array.array('l')
+        self._epoch = array.array('l')
+        self._version = array.array('l')
+        self._release = array.array('l')
+        self._distepoch = array.array('l')
+        self._disttag = array.array('l')
+        self._group = array.array('l')
+        self._media = array.array('l')
+        self._size = array.array('l')
+        self._installtime = array.array('l')
+        self._summary = []
+        ## Data derived from the columns, dropped when they change ...
+        self._types = {}  # { package id: versions_by_type() }
+        self._rpms = {}  # { version id: RpmPackage }
+
+    def __len__(self):
+        return len(self._package_ids)
+
+    def __contains__(self, na):
+        return na in self._package_ids
+
+    def __iter__(self):
+        return iter(self._package_ids)
+
+    def __getitem__(self, na):
+        return PackageView(self, self._package_ids[na])
+
+    def get(self, na, default=None):
+        id = self._package_ids.get(na)
+        if id is None:
+            return default
+        return PackageView(self, id)
+
+    def itervalues(self):
+        for id in self._package_ids.itervalues():
+            yield PackageView(self, id)
+
+    def add_version(self, rpm):
+        """Add a version read from rpmdb or a media."""
+        package_id = self._get_or_create(rpm.na)
+        version_id = self.find_version(package_id, rpm.evrd)
+        if version_id is None:
+            self._add_row(package_id, rpm)
+        elif self.is_installed(version_id):
+            if rpm.installtime is not None:
+                log.error('found two versions installed of the '
+                          'same package %s: %s and %s',
+                          rpm.na,
+                          rpm.evrd,
+                          self.evrd(version_id))
+            elif self._media[version_id] != NO_STRING:
+                log.warning('found versions of package %s '
+                            'in two diferent medias: %s and %s',
+                            rpm.na,
+                            rpm.media,
+                            self._strings[self._media[version_id]])
+            else:
+                self._media[version_id] = self._strings.id(rpm.media)
+                self._changed(version_id)
+        elif rpm.installtime is not None:
+            self._set_row(version_id, rpm, media=self._media[version_id])
+        else:
+            self._set_row(version_id, rpm)
+
+    def add_installed(self, rpm):
+        """Add a version found installed in rpmdb."""
+        package_id = self._get_or_create(rpm.na)
+        version_id = self.find_version(package_id, rpm.evrd)
+        if version_id is None:
+            self._add_row(package_id, rpm)
+        elif not self.is_installed(version_id):
+            self._set_row(version_id, rpm, media=self._media[version_id])
+
+    def remove_installed(self, na, evrd):
+        """Remove a version found removed from rpmdb, keeping it as an
+        update if it's available in a media.  The package is dropped if
+        no versions are left.
+        """
+        package_id = self._package_ids.get(na)
+        if package_id is None:
+            return
+        version_id = self.find_version(package_id, evrd)
+        if version_id is None or not self.is_installed(version_id):
+            return
+        if self._media[version_id] == NO_STRING:
+            versions = list(self._versions[package_id])
+            versions.remove(version_id)
+            self._versions[package_id] = tuple(versions)
+            self._changed(version_id)
+            if not versions:
+                del self._package_ids[na]
+        else:
+            self.set_installtime(version_id, None)
+
+    #
+    # Column access used by PackageView ...
+    #
+
+    def find_version(self, package_id, evrd):
+        """Return the version id of evrd in a package, or None."""
+        for version_id in self._versions[package_id]:
+            if self.evrd_key(version_id) == evrd.key:
+                return version_id
+        return None
+
+    def is_installed(self, version_id):
+        return self._installtime[version_id] != NO_INSTALLTIME
+
+    def set_installtime(self, version_id, installtime):
+        """Mark a version installed at installtime, or not installed
+        if it's None.
+        """
+        if installtime is None:
+            installtime = NO_INSTALLTIME
+        self._installtime[version_id] = int(installtime)
+        self._changed(version_id)
+
+    def evrd_key(self, version_id):
+        return (self._epoch[version_id],
+                self._string_key(self._version[version_id]),
+                self._string_key(self._release[version_id]),
+                self._string_key(self._distepoch[version_id]))
+
+    def evrd(self, version_id):
+        """Return the RpmEVRD of a version."""
+        return RpmEVRD.from_values(self._epoch[version_id],
+                                   self._strings[self._version[version_id]],
+                                   self._strings[self._release[version_id]],
+                                   self._strings[self._distepoch[version_id]],
+                                   key=self.evrd_key(version_id))
+
+    def rpm(self, version_id):
+        """Return a RpmPackage with the data of a version, shared by
+        callers until the version changes.
+        """
+        rpm = self._rpms.get(version_id)
+        if rpm is None:
+            rpm = self._build_rpm(version_id)
+            self._rpms[version_id] = rpm
+        return rpm
+
+    def _build_rpm(self, version_id):
+        strings = self._strings
+        name, arch = self._nas[self._package[version_id]]
+        installtime = self._installtime[version_id]
+        if installtime == NO_INSTALLTIME:
+            installtime = None
+        evrd = self.evrd(version_id)
+        return RpmPackage.from_record(
+                   (name,
+                    evrd.version,
+                    evrd.release,
+                    arch,
+                    evrd.epoch,
+                    self._size[version_id],
+                    strings[self._group[version_id]],
+                    self._summary[version_id],
+                    strings[self._disttag[version_id]],
+                    evrd.distepoch),
+                   media=strings[self._media[version_id]],
+                   installtime=installtime,
+                   evrd=evrd
+               )
+
+    def versions_by_type(self, package_id):
+        """Return lists of installed, upgrade and downgrade version ids
+        of a package, each one sorted by evrd.
+
+        Versions not installed are upgrades if they're newer than the
+        latest installed version, downgrades otherwise.  The lists are
+        kept until versions of the package change.
+        """
+        types = self._types.get(package_id)
+        if types is not None:
+            return types
+        versions = self._versions[package_id]
+        installs = tuple(version_id for version_id in versions
+                             if self.is_installed(version_id))
+        if not installs:
+            types = ((), versions, ())
+        else:
+            latest_key = self.evrd_key(installs[-1])
+            upgrades = []
+            downgrades = []
+            for version_id in versions:
+                if self.is_installed(version_id):
+                    continue
+                if self.evrd_key(version_id) > latest_key:
+                    upgrades.append(version_id)
+                else:
+                    downgrades.append(version_id)
+            types = (installs, tuple(upgrades), tuple(downgrades))
+        self._types[package_id] = types
+        return types
+
+    def version_type(self, package_id, version_id):
+        installs, upgrades, _ = self.versions_by_type(package_id)
+        if version_id in installs:
+            return 'installed'
+        elif version_id in upgrades:
+            return 'upgrade'
+        return 'downgrade'
+
+    def _string_key(self, string_id):
+        key = self._string_keys.get(string_id)
+        if key is None:
+            key = version_key(self._strings[string_id])
+            self._string_keys[string_id] = key
+        return key
+
+    def _get_or_create(self, na):
+        package_id = self._package_ids.get(na)
+        if package_id is None:
+            package_id = len(self._nas)
+            self._nas.append(na)
+            self._versions.append(())
+            self._in_progress.append(0)
+            self._progress.append(NO_PROGRESS)
+            self._package_ids[na] = package_id
+        return package_id
+
+    def _add_row(self, package_id, rpm):
+        """Append a row for a new version of a package."""
+        version_id = len(self._package)
+        self._package.append(package_id)
+        for column in (self._epoch, self._version, self._release,
+                       self._distepoch, self._disttag, self._group,
+                       self._media, self._size, self._installtime):
+            column.append(0)
+        self._summary.append(None)
+        self._set_row(version_id, rpm)
+        versions = self._versions[package_id]
+        keys = [self.evrd_key(id) for id in versions]
+        i = bisect.bisect(keys, self.evrd_key(version_id))
+        self._versions[package_id] \
+            = versions[:i] + (version_id,) + versions[i:]
+        self._changed(version_id)
+        return version_id
+
+    def _set_row(self, version_id, rpm, media=None):
+        """Store the data of rpm in a version row, media is the string
+        id to use instead of rpm.media.
+        """
+        strings = self._strings
+        self._epoch[version_id] = rpm.epoch
+        self._version[version_id] = strings.id(rpm.version)
+        self._release[version_id] = strings.id(rpm.release)
+        self._distepoch[version_id] = strings.id(rpm.distepoch)
+        self._disttag[version_id] = strings.id(rpm.disttag)
+        self._group[version_id] = strings.id(rpm.group)
+        if media is None:
+            media = strings.id(rpm.media)
+        self._media[version_id] = media
+        self._size[version_id] = rpm.size
+        if rpm.installtime is None:
+            self._installtime[version_id] = NO_INSTALLTIME
+        else:
+            self._installtime[version_id] = int(rpm.installtime)
+        self._summary[version_id] = rpm.summary
+        self._changed(version_id)
+
+    def _changed(self, version_id):
+        """Drop data derived from a version row and its package."""
+        self._rpms.pop(version_id, None)
+        self._types.pop(self._package[version_id], None)
+
+
+class PackageView(object):
+    """Package interface over a package of a ColumnarCatalog.
+
+    Views are created on access and hold no state, so any number of
+    them may exist for the same package.
+    """
+
+    __slots__ = ('_catalog', '_id')
+
+    def __init__(self, catalog, package_id):
+        self._catalog = catalog
+        self._id = package_id
+
+    def __getitem__(self, key):
+        return self._catalog.rpm(self._get_version(key))
+
+    def __eq__(self, other):
+        return (isinstance(other, PackageView)
+                    and self._catalog is other._catalog
+                    and self._id == other._id)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._id)
+
+    @property
+    def na(self):
+        return self._catalog._nas[self._id]
+
+    @property
+    def name(self):
+        return self.na[0]
+
+    @property
+    def arch(self):
+        return self.na[1]
+
+    @property
+    def urpmi(self):
+        return self._catalog.urpmi
+
+    @property
+    def in_progress(self):
+        return IN_PROGRESS_CODES[self._catalog._in_progress[self._id]]
+
+    @in_progress.setter
+    def in_progress(self, value):
+        self._catalog._in_progress[self._id] = IN_PROGRESS_CODES.index(value)
+
+    @property
+    def progress(self):
+        progress = self._catalog._progress[self._id]
+        if progress == NO_PROGRESS:
+            return None
+        return progress
+
+    @progress.setter
+    def progress(self, value):
+        if value is None:
+            value = NO_PROGRESS
+        self._catalog._progress[self._id] = value
+
+    @property
+    def status(self):
+        """Package entry status."""
+        in_progress = self.in_progress
+        if in_progress is not None:
+            return in_progress
+        return self.current_status
+
+    @property
+    def current_status(self):
+        """Package status prior to action."""
+        if self.has_installs:
+            if self.has_upgrades:
+                return 'upgrade'
+            return 'installed'
+        return 'new'
+
+    @property
+    def is_empty(self):
+        return not self._catalog._versions[self._id]
+
+    @property
+    def has_installs(self):
+        return bool(self._by_type()[0])
+
+    @property
+    def has_upgrades(self):
+        return bool(self._by_type()[1])
+
+    @property
+    def has_downgrades(self):
+        return bool(self._by_type()[2])
+
+    @property
+    def installs(self):
+        """List of installed rpms."""
+        return map(self._catalog.rpm, self._by_type()[0])
+
+    @property
+    def upgrades(self):
+        """List of upgrade rpms."""
+        return map(self._catalog.rpm, self._by_type()[1])
+
+    @property
+    def downgrades(self):
+        """List of downgrade rpms."""
+        return map(self._catalog.rpm, self._by_type()[2])
+
+    @property
+    def latest_installed(self):
+        """Most recent installed rpm."""
+        return self._catalog.rpm(self._by_type()[0][-1])
+
+    @property
+    def latest_upgrade(self):
+        """Most recent upgrade rpm."""
+        return self._catalog.rpm(self._by_type()[1][-1])
+
+    @property
+    def latest(self):
+        """The latest representative package, based on status."""
+        in_progress = self.in_progress
+        if in_progress == 'installing':
+            return self.latest_upgrade
+        elif in_progress == 'removing':
+            return self.latest_installed
+        elif self.current_status in {'new'}:
+            return self.latest_upgrade
+        else:
+            return self.latest_installed
+
+    def on_download_start(self, evrd):
+        """React to the start of a version download."""
+        assert self.in_progress == 'installing'
+        assert self._get_type(evrd) == 'upgrade'
+        self.progress = 0.0
+
+    def on_download_progress(self, evrd, fraction):
+        """React to the progress of a version download."""
+        assert self.in_progress == 'installing'
+        assert self._get_type(evrd) == 'upgrade'
+        self.progress = fraction / 2.0
+
+    def on_download_done(self, evrd):
+        """React to the end of a version download."""
+        assert self.in_progress == 'installing'
+        assert self._get_type(evrd) == 'upgrade'
+        self.progress = 0.5
+        log.debug('downloaded %s-%s-%s.%s',
+                  self.name,
+                  evrd.version,
+                  evrd.release,
+                  self.arch)
+
+    def on_install_start(self, evrd):
+        """React to the start of installation of a version."""
+        assert self.in_progress == 'installing'
+        assert self._get_type(evrd) == 'upgrade'
+        self.progress = 0.5
+
+    def on_install_progress(self, evrd, fraction):
+        """React to the progress of installation of a version."""
+        assert self.in_progress == 'installing'
+        assert self._get_type(evrd) == 'upgrade'
+        self.progress = 0.5 + (fraction / 2.0)
+
+    def on_install_done(self, evrd):
+        """React to the end of installation of a version."""
+        assert self.in_progress == 'installing'
+        version_id = self._get_version(evrd)
+        assert self._get_type(evrd) == 'upgrade'
+        self.in_progress = None
+        self._catalog.set_installtime(version_id, time.time())
+        log.debug('installed %s-%s-%s.%s',
+                  self.name,
+                  evrd.version,
+                  evrd.release,
+                  self.arch)
+
+    def on_remove_start(self, evrd):
+        """React to the start of a version removal."""
+        assert self.in_progress == 'removing'
+        assert self._get_type(evrd) == 'installed'
+        self.progress = 0.0
+
+    def on_remove_progress(self, evrd, fraction):
+        assert self.in_progress == 'removing'
+        assert self._get_type(evrd) == 'installed'
+        self.progress = fraction
+
+    def on_remove_done(self, evrd):
+        """React to the end of removal of a version."""
+        assert self.in_progress == 'removing'
+        version_id = self._get_version(evrd)
+        assert self._get_type(evrd) == 'installed'
+        self.in_progress = None
+        self._catalog.set_installtime(version_id, None)
+        log.debug('removed %s-%s-%s.%s',
+                  self.name,
+                  evrd.version,
+                  evrd.release,
+                  self.arch)
+
+    def _by_type(self):
+        return self._catalog.versions_by_type(self._id)
+
+    def _get_version(self, key):
+        if isinstance(key, RpmEVRD):
+            evrd = key
+        else:
+            evrd = create_evrd(key)
+        version_id = self._catalog.find_version(self._id, evrd)
+        if version_id is None:
+            raise KeyError, 'not version of %s: %s' % (self.na, evrd)
+        return version_id
+
+    def _get_type(self, evrd):
+        return self._catalog.version_type(self._id, self._get_version(evrd))
+
+    def __repr__(self):
+        return '%s%s:%s' % (self.__class__.__name__,
+                            self.na,
+                            self._id)
+
+
+## Catalog classes by the names used to configure UrpmiDB ...
+CATALOGS = {'objects': PackageCatalog,
+            'columnar': ColumnarCatalog}
@@ -0,0 +1,171 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Integer coded columns filtered with boolean masks.
+
+Masks are NumPy boolean arrays if NumPy is available, lists of bools
+otherwise.
+"""
+
+
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CodedColumns(object):
+    """Columns of values aligned with a list of rows, each value
+    stored as the integer code of its column.
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self._columns = {}
+        self._values = {}  # { column name: [value] }
+        self._codes = {}  # { column name: { value: code } }
+        self._counts = {}  # { column name: [number of rows by code] }
+        self.rebuild([])
+
+    def __len__(self):
+        return self._len
+
+    def rebuild(self, rows):
+        """Replace the columns data by rows, a list of tuples of
+        values in the order of column names.
+        """
+        self._len = len(rows)
+        for name in self.names:
+            self._values[name] = []
+            self._codes[name] = {}
+            self._counts[name] = []
+        for i, name in enumerate(self.names):
+            column = [self._code(name, row[i]) for row in rows]
+            counts = self._counts[name]
+            for code in column:
+                counts[code] += 1
+            if numpy is not None:
+                column = numpy.array(column, dtype=numpy.int32)
+            self._columns[name] = column
+
+    def get(self, name, index):
+        """Return the value of a row in a column."""
+        return self._values[name][self._columns[name][index]]
+
+    def set_row(self, index, row):
+        """Update the values of a row."""
+        for name, value in zip(self.names, row):
+            self.set(name, index, value)
+
+    def set(self, name, index, value):
+        """Update the value of a row in a column."""
+        column = self._columns[name]
+        counts = self._counts[name]
+        code = self._code(name, value)
+        counts[column[index]] -= 1
+        counts[code] += 1
+        column[index] = code
+
+    def counts(self, name):
+        """Return a dict with the number of rows of each value of a
+        column, kept up to date as rows change.
+        """
+        return dict((value, count)
+                        for value, count in zip(self._values[name],
+                                                self._counts[name])
+                        if count)
+
+    def count_rows(self, name, indexes):
+        """Return a dict with the number of rows of each value of a
+        column among the rows at indexes.
+        """
+        values = self._values[name]
+        column = self._columns[name]
+        if numpy is not None:
+            counts = numpy.bincount(column[indexes], minlength=len(values))
+            counts = counts.tolist()
+        else:
+            counts = [0] * len(values)
+            for i in indexes:
+                counts[column[i]] += 1
+        return dict((value, count)
+                        for value, count in zip(values, counts)
+                        if count)
+
+    def match(self, name, predicate):
+        """Return the mask of rows whose value in a column satisfies
+        predicate, which is called once for each distinct value.
+        """
+        table = [predicate(value) for value in self._values[name]]
+        column = self._columns[name]
+        if numpy is not None:
+            return numpy.array(table, dtype=bool)[column]
+        return [table[code] for code in column]
+
+    def match_values(self, name, values):
+        """Return the mask of rows whose value in a column is one of
+        values.
+        """
+        codes = self._codes[name]
+        matched = set(codes[value] for value in values if value in codes)
+        column = self._columns[name]
+        if numpy is not None:
+            return numpy.in1d(column, list(matched))
+        return [code in matched for code in column]
+
+    def _code(self, name, value):
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            values = self._values[name]
+            code = len(values)
+            values.append(value)
+            codes[value] = code
+            self._counts[name].append(0)
+        return code
+
+
+def mask_not(mask):
+    if numpy is not None:
+        return ~mask
+    return [not value for value in mask]
+
+
+def mask_and(mask, other):
+    if numpy is not None:
+        return mask & other
+    return [a and b for a, b in itertools.izip(mask, other)]
+
+
+def mask_indexes(mask):
+    """Return the list of row indexes selected by mask."""
+    if numpy is not None:
+        return numpy.flatnonzero(mask).tolist()
+    return [i for i, value in enumerate(mask) if value]
+
+
+def mask_to_list(mask):
+    """Return the list of bools of a mask, for access by row index."""
+    if numpy is not None:
+        return mask.tolist()
+    return mask
@@ -25,8 +25,10 @@
 
 import os
 import os.path
-import subprocess
 import re
+import time
+import collections
+import multiprocessing
 import pyinotify
 import gobject
 import logging
@@ -36,14 +38,46 @@ import os.path
 
 import mdvpkg
 import mdvpkg.urpmi.task
+import mdvpkg.urpmi.resolver
+import mdvpkg.urpmi.catalog
+from mdvpkg.urpmi import columns
+from mdvpkg.urpmi import index
+from mdvpkg.urpmi import progress
+from mdvpkg.urpmi import protocol
 import mdvpkg.exceptions
 from mdvpkg.urpmi.media import UrpmiMedia
+from mdvpkg.urpmi.media import RECORD_FIELDS
 from mdvpkg.urpmi.packages import RpmPackage
-from mdvpkg.urpmi.packages import Package
 
 
 log = logging.getLogger('mdvpkgd.urpmi')
 
+## Time (in ms) rpmdb must be left unchanged before installed packages
+## are updated, so a transaction is handled once:
+RPMDB_SETTLE_TIME = 1000
+
+## Query format used to read installed packages, with fields ordered as
+## RECORD_FIELDS followed by installtime.  Summary is the last field so
+## tabs in it don't break the split:
+RPMDB_QUERY_FORMAT = '\t'.join((
+    '%{NAME}',
+    '%{VERSION}',
+    '%{RELEASE}',
+    '%{ARCH}',
+    '%|EPOCH?{%{EPOCH}}:{0}|',
+    '%{SIZE}',
+    '%{GROUP}',
+    '%|DISTTAG?{%{DISTTAG}}|',
+    '%|DISTEPOCH?{%{DISTEPOCH}}|',
+    '%{INSTALLTIME}',
+    '%{SUMMARY}',
+))
+
+## rpmdb is only enumerated, there's no need to check header digests
+## and signatures:
+RPMDB_VSFLAGS = (getattr(rpm, '_RPMVSF_NODIGESTS', 0)
+                     | getattr(rpm, '_RPMVSF_NOSIGNATURES', 0))
+
 
 def expand_line(line):
     """Look for $HOST, $ARCH and $RELEASE to expand."""
@@ -160,6 +194,28 @@ def parse_configuration(conf_path):
     return global_block, medias
 
 
+def _list_media_records(media_args):
+    """Process pool worker returning the package records of a media
+    created from media_args.
+    """
+    name, mediadict, data_dir, cache_dir = media_args
+    media = UrpmiMedia(name, mediadict,
+                       data_dir=data_dir,
+                       cache_dir=cache_dir)
+    return media.list_records()
+
+
+def package_sort_key(package, key_name):
+    """Return the value of a package for the list sort key key_name:
+    'status' or an attribute of its latest version.
+    """
+    if key_name is None:
+        return None
+    elif key_name == 'status':
+        return package.status
+    return getattr(package.latest, key_name)
+
+
 class UrpmiDB(mdvpkg.ConnectableObject):
     """Provide access to the urpmi database of medias and packages."""
 
@@ -168,18 +224,55 @@ class UrpmiDB(mdvpkg.ConnectableObject):
                  data_dir='/var/lib/urpmi',
                  conf_file='urpmi.cfg',
                  rpm_dbpath=None,
-                 backend_dir=None):
+                 backend_dir=None,
+                 cache_dir='/var/cache/mdvpkg',
+                 load_workers=1,
+                 resolve_cache_size=64,
+                 catalog='objects',
+                 progress_rate=10):
         self._conf_dir = os.path.abspath(conf_dir)
         self._data_dir = os.path.abspath(data_dir)
+        if cache_dir is not None:
+            cache_dir = os.path.abspath(cache_dir)
+        self._cache_dir = cache_dir
+        # number of processes reading medias, 1 to read them serially:
+        self._load_workers = load_workers
+        # generation of the package database, bumped every time rpmdb
+        # or medias change:
+        self._generation = 0
+        # LRU cache of resolver responses, keyed by selections and
+        # generation:
+        self._resolve_cache = collections.OrderedDict()
+        self._resolve_cache_size = resolve_cache_size
+        self._resolve_cache_hits = 0
+        self._resolve_cache_misses = 0
         self._conf_path = '%s/%s' % (self._conf_dir, conf_file)
         self._rpm_dbpath = rpm_dbpath
         if backend_dir is None:
             self.backend_dir = mdvpkg.DEFAULT_BACKEND_DIR
         else:
             self.backend_dir = backend_dir
-        self._cache = {}  # package cache with data read from medias
+        # package cache with data read from medias, see
+        # mdvpkg.urpmi.catalog.CATALOGS for the available stores:
+        self._cache = mdvpkg.urpmi.catalog.CATALOGS[catalog](self)
+        # (na, evrd) of installed packages by rpmdb header instance:
+        self._installed = {}
+        self._rpmdb_timeout = None
+        # rpmdb changed while loading, after it was read:
+        self._rpmdb_pending = False
+        # download, install and remove progress signals of running
+        # tasks, delivered at most progress_rate times per second:
+        self._progress = progress.ProgressCoalescer(self.emit,
+                                                    progress_rate)
         self._medias = None
         self._conf = None
+        self._ready = False
+        # search indexes, built on demand for the current generation:
+        self._name_index = None
+        self._search_index = None
+        self._group_tree = None
+        # { key name: sorted list of (name, arch) }, see sort_order():
+        self._sort_orders = {}
 
         ## Set up inotify for changes in configuration file, use
         ## gobject.io_add_watch() for new inotify events ...
@@ -189,6 +282,20 @@ class UrpmiDB(mdvpkg.ConnectableObject):
                     | pyinotify.IN_MODIFY
                     | pyinotify.IN_MOVE_SELF)
         self.ino_watch = wm.add_watch(self._conf_dir, mask)
+        ## ... and for changes in rpmdb ...
+        rpmdb_mask = (pyinotify.IN_MODIFY
+                          | pyinotify.IN_CLOSE_WRITE
+                          | pyinotify.IN_CREATE
+                          | pyinotify.IN_MOVED_TO)
+        if self._rpm_dbpath is not None:
+            rpmdb_dir = self._rpm_dbpath
+        else:
+            rpmdb_dir = rpm.expandMacro('%{_dbpath}')
+        self.rpmdb_ino_watch = wm.add_watch(
+                                   rpmdb_dir,
+                                   rpmdb_mask,
+                                   proc_fun=self._rpmdb_ino_handler
+                               )
         self.ino_notifier \
             = pyinotify.Notifier(wm, self._conf_dir_ino_handler)
         # FIXME Should we handle error conditions in the inotify file
@@ -197,6 +304,9 @@ class UrpmiDB(mdvpkg.ConnectableObject):
                              gobject.IO_IN,
                              self._ino_in_callback)
         self._runner = mdvpkg.urpmi.task.UrpmiRunner(self.backend_dir)
+        self._resolver = mdvpkg.urpmi.resolver.UrpmiResolver(
+                             self.backend_dir
+                         )
         super(UrpmiDB, self).__init__(signals=['download-start',
                                                'download-progress',
                                                'download-end',
@@ -210,7 +320,10 @@ class UrpmiDB(mdvpkg.ConnectableObject):
                                                'task-queued',
                                                'task-running',
                                                'task-progress',
-                                               'task-done'])
+                                               'task-done',
+                                               'loading-progress',
+                                               'loaded',
+                                               'load-error'])
 
     def configure_medias(self):
         """Read configuration file, locate and populate the list of
@@ -218,24 +331,132 @@ class UrpmiDB(mdvpkg.ConnectableObject):
         """
         log.debug('reading %s to list medias', self._conf_path)
         self._config, media_blocks = parse_configuration(self._conf_path)
-        self._medias = {}
+        self._medias = collections.OrderedDict()
         for media in media_blocks:
             self._medias[media['name']] \
                 = UrpmiMedia(media['name'],
                              media,
-                             data_dir=self._data_dir)
+                             data_dir=self._data_dir,
+                             cache_dir=self._cache_dir)
 
     def list_active_medias(self):
         """Return a list of active configured medias objects."""
         return filter(lambda media: media.ignore is False,
                       self._medias.values())
 
+    @property
+    def ready(self):
+        """True if the package cache has been loaded."""
+        return self._ready
+
     def load_packages(self):
         """Load package information from rpmdb and active medias and
         generate the package cache.
         """
-        self._load_installed_packages()
-        self._load_active_media_packages()
+        for _ in self._load():
+            pass
+
+    def load_packages_async(self, time_slice=0.05):
+        """Load the package cache in the background from the gobject
+        main loop, processing packages for at most time_slice seconds
+        in each loop iteration.
+
+        'loading-progress' is emitted as each stage of the load is
+        finished and 'loaded' (or 'load-error') when it's done.
+        """
+        gobject.idle_add(self._load_step, self._load(), time_slice)
+
+    def _load_step(self, loader, time_slice):
+        """Idle callback running the loader generator for a slice of
+        time.
+        """
+        deadline = time.time() + time_slice
+        try:
+            for _ in loader:
+                if time.time() >= deadline:
+                    return True
+        except Exception as e:
+            log.exception('failed to load package cache')
+            self.emit('load-error', str(e))
+        return False
+
+    def _load(self):
+        """Generator loading the package cache, yielding control after
+        each package read.
+        """
+        self._ready = False
+        self._rpmdb_pending = False
+        if self._medias is None:
+            self.configure_medias()
+        medias = self.list_active_medias()
+        total = len(medias) + 1
+        for _ in self._load_installed_packages():
+            yield
+        self.emit('loading-progress', 'rpmdb', 1, total)
+        for _ in self._load_active_media_packages(medias):
+            yield
+        if self._rpmdb_pending:
+            self._rpmdb_pending = False
+            self._apply_rpmdb_changes()
+        self._clear_indexes()
+        self._ready = True
+        self.emit('loaded')
+
+    @property
+    def generation(self):
+        """Counter of changes in rpmdb or medias."""
+        return self._generation
+
+    @property
+    def resolve_cache_stats(self):
+        """Dict of resolution cache counters."""
+        return {'hits': self._resolve_cache_hits,
+                'misses': self._resolve_cache_misses,
+                'size': len(self._resolve_cache),
+                'max-size': self._resolve_cache_size}
+
+    @property
+    def name_index(self):
+        """Index of package names, see mdvpkg.urpmi.index.NameIndex."""
+        if self._name_index is None:
+            self._name_index = index.NameIndex(na[0] for na in self._cache)
+        return self._name_index
+
+    @property
+    def search_index(self):
+        """Index of words in package names and summaries, see
+        mdvpkg.urpmi.index.SearchIndex.
+        """
+        if self._search_index is None:
+            summaries = ((package.name, package.latest.summary)
+                         for package in self._cache.itervalues())
+            self._search_index = index.SearchIndex(summaries)
+        return self._search_index
+
+    @property
+    def group_tree(self):
+        """Tree of package groups, see mdvpkg.urpmi.index.GroupTree."""
+        if self._group_tree is None:
+            groups = (package.latest.group
+                      for package in self._cache.itervalues())
+            self._group_tree = index.GroupTree(groups)
+        return self._group_tree
+
+    def sort_order(self, key_name):
+        """Return the list of (name, arch) of all packages sorted by
+        package_sort_key() and name.
+
+        The list is shared by all callers until packages change, it
+        must not be modified.
+        """
+        order = self._sort_orders.get(key_name)
+        if order is None:
+            keys = [(package_sort_key(package, key_name), package.na)
+                    for package in self._cache.itervalues()]
+            keys.sort()
+            order = [na for _, na in keys]
+            self._sort_orders[key_name] = order
+        return order
 
     def get_package(self, name_arch):
         return self._cache[name_arch]
@@ -245,21 +466,15 @@ class UrpmiDB(mdvpkg.ConnectableObject):
         """
         return self._cache.itervalues()
 
-    def resolve_deps(self, installs=[], removes=[]):
-        """Resolve all install deps to install package and return a
-        dictionary of actions.
-        """
+    def resolve_deps(self, installs, removes,
+                     reply_handler, error_handler):
+        """Resolve all deps to install and remove packages.
 
-        selected = {'action-install': [],
-                    'action-auto-install': [],
-                    'action-remove': [],
-                    'action-auto-remove': []}
-        rejected = {}
-        backend = subprocess.Popen(os.path.join(self.backend_dir,
-                                                'resolve.pl'),
-                                   shell=True,
-                                   stdin=subprocess.PIPE,
-                                   stdout=subprocess.PIPE)
+        Resolution is done by the resolver backend without blocking
+        the main loop: reply_handler is later called with a
+        dictionary of actions and a dictionary of rejections, or
+        error_handler with an exception.
+        """
         # ATTENTION: We're using RpmPackage.__str__() as argument to
         #            the backend.
         args = []
@@ -269,43 +484,112 @@ class UrpmiDB(mdvpkg.ConnectableObject):
         for remove in removes:
             name = '%s' % (self._cache[remove].latest_installed)
             args.append('r:' + name)
-        backend.stdin.write('%s\n' % '\t'.join(args))
-        for line in backend.communicate()[0].split('\n'):
-            if line.startswith('%MDVPKG '):
-                fields = line.replace('%MDVPKG ', '', 1).split('\t')
-                if fields[0] == 'ERROR':
-                    msg = 'Backend error: %s' % ' '.join(fields[1:])
-                    raise mdvpkg.exceptions.MdvPkgError, msg
-                elif fields[0] == 'SELECTED':
-                    action, na_evrd = fields[1:]
-                    na, evrd = eval(na_evrd)
-                    if self._cache[na].in_progress is not None:
-                        raise PackageInProgressConflict
-                    selected[action].append((na, evrd))
-                elif fields[0] == 'REJECTED':
-                    reason, na_evrd = fields[1:3]
-                    na, evrd = eval(na_evrd)
-                    if reason == 'reject-install-unsatisfied':
-                        subjects = fields[3:]
-                    elif reason in {'reject-install-conflicts',
-                                    'reject-install-rejected-dependency',
-                                    'reject-remove-depends'}:
-                        subjects = []
-                        for na_s, evrd_s in [eval(pt) for pt in fields[3:]]:
-                            subjects.append(self._cache[na_s][evrd_s])
-                    else:
-                        subjects = None
-                    rej_list = rejected.get(reason)
-                    if rej_list is None:
-                        rej_list = []
-                        rejected[reason] = rej_list
-                    rej = { 'package':
-                                self._cache[na],
-                            'rpm':
-                                self._cache[na][evrd] }
-                    if subjects:
-                        rej['subjects'] = subjects
-                    rej_list.append(rej)
+
+        def on_resolved(responses):
+            if generation == self._generation:
+                self._cache_resolution(key, responses)
+            try:
+                selected, rejected = self._parse_resolution(responses)
+            except Exception as e:
+                error_handler(e)
+            else:
+                reply_handler(selected, rejected)
+
+        generation = self._generation
+        key = (frozenset(installs), frozenset(removes), generation)
+        responses = self._resolve_cache.pop(key, None)
+        if responses is not None:
+            self._resolve_cache_hits += 1
+            self._resolve_cache[key] = responses
+            self._log_resolve_cache('hit')
+        else:
+            self._resolve_cache_misses += 1
+            self._log_resolve_cache('miss')
+        self._resolver.resolve(args, on_resolved, error_handler, responses)
+
+    def _cache_resolution(self, key, responses):
+        """Store resolver responses, evicting the least recently used
+        entries.
+        """
+        if self._resolve_cache_size <= 0:
+            return
+        self._resolve_cache.pop(key, None)
+        self._resolve_cache[key] = responses
+        while len(self._resolve_cache) > self._resolve_cache_size:
+            self._resolve_cache.popitem(last=False)
+            self._log_resolve_cache('eviction')
+
+    def _log_resolve_cache(self, event):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('resolve cache %s: %s hits, %s misses, '
+                      '%s of %s entries',
+                      event,
+                      self._resolve_cache_hits,
+                      self._resolve_cache_misses,
+                      len(self._resolve_cache),
+                      self._resolve_cache_size)
+
+    def _on_db_changed(self):
+        """Handle changes in rpmdb or medias, invalidating data
+        derived from them.
+        """
+        self._generation += 1
+        self._resolve_cache.clear()
+        self._clear_indexes()
+        self._resolver.reload()
+
+    def _clear_indexes(self):
+        self._name_index = None
+        self._search_index = None
+        self._group_tree = None
+        self._sort_orders.clear()
+
+    def _emit_package_changed(self, na_list):
+        """Emit package-changed for (name, arch) of changed packages,
+        dropping the sort orders they were part of.
+        """
+        self._sort_orders.clear()
+        self.emit('package-changed', na_list)
+
+    def _parse_resolution(self, responses):
+        """Return the actions and rejections in decoded resolver
+        responses.
+        """
+        selected = {'action-install': [],
+                    'action-auto-install': [],
+                    'action-remove': [],
+                    'action-auto-remove': []}
+        rejected = {}
+        for response in responses:
+            tag = response[0]
+            if tag == 'ERROR':
+                msg = 'Backend error: %s' % ' '.join(response[1:])
+                raise mdvpkg.exceptions.MdvPkgError, msg
+            elif tag == 'SELECTED':
+                _, action, (na, evrd) = response
+                if self._cache[na].in_progress is not None:
+                    raise mdvpkg.exceptions.PackageInProgressConflict
+                selected[action].append((na, evrd))
+            elif tag == 'REJECTED':
+                _, reason, (na, evrd), subjects = response
+                if reason == 'reject-install-unsatisfied':
+                    subjects = list(subjects)
+                elif reason in protocol.PACKAGE_SUBJECT_REASONS:
+                    subjects = [self._cache[na_s][evrd_s]
+                                    for na_s, evrd_s in subjects]
+                else:
+                    subjects = None
+                rej_list = rejected.get(reason)
+                if rej_list is None:
+                    rej_list = []
+                    rejected[reason] = rej_list
+                rej = { 'package':
+                            self._cache[na],
+                        'rpm':
+                            self._cache[na][evrd] }
+                if subjects:
+                    rej['subjects'] = subjects
+                rej_list.append(rej)
         return selected, rejected
 
     def auto_select(self):
@@ -314,6 +598,18 @@ class UrpmiDB(mdvpkg.ConnectableObject):
         """
         raise NotImplementedError
 
+    def mark_in_progress(self, installs, removes):
+        """Mark packages, lists of (name, arch) tuples, as being
+        installed or removed and emit package-changed for them.
+        """
+        for in_progress, na_list in (('installing', installs),
+                                     ('removing', removes)):
+            for na in na_list:
+                package = self._cache[na]
+                package.in_progress = in_progress
+                package.progress = 0.0
+        self._emit_package_changed(list(installs) + list(removes))
+
     def run_task(self, install=[], remove=[]):
         """Create task to install names, a list of (name, arch)
         tuples.
@@ -329,56 +625,169 @@ class UrpmiDB(mdvpkg.ConnectableObject):
                                  (install_names,remove_names))
 
     def _load_installed_packages(self):
-        """Visit rpmdb and load data from installed packages."""
+        """Generator visiting rpmdb and loading data from installed
+        packages.
+        """
         log.info('reading installed packages.')
+        self._installed = {}
+        for instance, header in self._match_rpmdb():
+            rpm_package = self._read_rpmdb_header(header)
+            self._on_package(rpm_package)
+            self._installed[instance] = (rpm_package.na, rpm_package.evrd)
+            yield
+
+    def _match_rpmdb(self, *query):
+        """Yield (instance, header) tuples for each package in rpmdb
+        matching query, the dbMatch() arguments.
+        """
+        if self._rpm_dbpath is not None:
+            rpm.addMacro('_dbpath', self._rpm_dbpath)
+        try:
+            ts = rpm.ts()
+            ts.setVSFlags(RPMDB_VSFLAGS)
+            mi = ts.dbMatch(*query)
+            for header in mi:
+                yield mi.instance(), header
+        finally:
+            if self._rpm_dbpath is not None:
+                rpm.delMacro('_dbpath')
+
+    def _rpmdb_instances(self):
+        """Return the set of header instances in rpmdb, read from the
+        name index without loading headers, or None if the rpm
+        bindings can't walk indexes.
+        """
         if self._rpm_dbpath is not None:
             rpm.addMacro('_dbpath', self._rpm_dbpath)
-        for pkg in rpm.ts().dbMatch():
-            # TODO Load capabilities information in the same manner
-            #      Media.list_medias() will return.
-            pkgdict = {}
-            for attr in ('name', 'version', 'release', 'arch', 'epoch',
-                         'size', 'group', 'summary', 'installtime',
-                         'disttag', 'distepoch'):
-                value = pkg[attr]
-                if type(value) is list and len(value) == 0:
-                    value = ''
-                pkgdict[attr] = value
-
-            if type(pkg['installtime']) is list:
-                pkgdict['installtime'] = pkg['installtime'][0]
-            if pkgdict['epoch'] is None:
-                pkgdict['epoch'] = 0
-            self._on_package_data(pkgdict)
-        rpm.delMacro('_dbpath')
-
-    def _load_active_media_packages(self):
-        """Load packages from active medias."""
+        try:
+            ts = rpm.ts()
+            if not hasattr(ts, 'dbIndex'):
+                return None
+            instances = set()
+            names = ts.dbIndex('name')
+            for _ in names:
+                instances.update(instance for instance, _
+                                     in names.instances())
+            return instances
+        finally:
+            if self._rpm_dbpath is not None:
+                rpm.delMacro('_dbpath')
+
+    def _read_rpmdb_header(self, header):
+        """Return the RpmPackage of a rpmdb header."""
+        # TODO Load capabilities information in the same manner
+        #      Media.list_medias() will return.
+        fields = header.sprintf(RPMDB_QUERY_FORMAT).split(
+                     '\t', len(RECORD_FIELDS)
+                 )
+        summary = fields.pop()
+        installtime = int(fields.pop())
+        fields.insert(RECORD_FIELDS.index('summary'), summary)
+        return RpmPackage.from_record(fields, installtime=installtime)
+
+    def _update_installed_packages(self):
+        """Apply changes in rpmdb to the package cache.
+
+        Header instances are compared with the ones previously seen,
+        and only headers of added instances are read.  Instances are
+        listed from the rpmdb name index, or by walking all headers if
+        the rpm bindings can't read indexes.  Return the set of (name,
+        arch) of changed packages.
+        """
+        changed = set()
+        instances = self._rpmdb_instances()
+        if instances is not None:
+            removed = set(self._installed) - instances
+            added = [(instance, self._read_rpmdb_header(header))
+                         for instance in instances - set(self._installed)
+                         for _, header in self._match_rpmdb(
+                                              rpm.RPMDBI_PACKAGES,
+                                              instance
+                                          )]
+        else:
+            removed = set(self._installed)
+            added = []
+            for instance, header in self._match_rpmdb():
+                if instance in removed:
+                    removed.remove(instance)
+                else:
+                    added.append((instance,
+                                  self._read_rpmdb_header(header)))
+        for instance in removed:
+            na, evrd = self._installed.pop(instance)
+            self._cache.remove_installed(na, evrd)
+            changed.add(na)
+        for instance, rpm_package in added:
+            self._cache.add_installed(rpm_package)
+            self._installed[instance] = (rpm_package.na, rpm_package.evrd)
+            changed.add(rpm_package.na)
+        return changed
+
+    def _load_active_media_packages(self, medias):
+        """Generator loading packages from active medias.
+
+        Medias are read in the given order, by worker processes if
+        more than one load worker is configured.  Control is yielded
+        after each package, while medias are checked and while waiting
+        for workers.
+        """
         log.info('reading packages from active medias.')
-        for media in self.list_active_medias():
-            for package_data in media.list():
-                package_data['media'] = media.name
-                self._on_package_data(package_data)
-
-    def _on_package_data(self, package_data):
-        """Handle package data found during cache update.
-
-        Add the package information to the package cache, updating or
-        creating entries.
+        if self._load_workers > 1 and len(medias) > 1:
+            records_iter = self._pool_list_records(medias)
+        else:
+            records_iter = (media.iter_records() for media in medias)
+        total = len(medias) + 1
+        for count, media in enumerate(medias, 2):
+            records = next(records_iter)
+            while records is None:
+                yield
+                records = next(records_iter)
+            for record in records:
+                if record is not None:
+                    self._on_package(
+                        RpmPackage.from_record(record, media=media.name)
+                    )
+                yield
+            self.emit('loading-progress', media.name, count, total)
+
+    def _pool_list_records(self, medias):
+        """Read medias records in a process pool, yielding them in the
+        same order of medias.  None is yielded while the next records
+        aren't ready.
+        """
+        pool = multiprocessing.Pool(min(self._load_workers, len(medias)))
+        try:
+            results = pool.imap(_list_media_records,
+                                [(media.name,
+                                  media.config,
+                                  self._data_dir,
+                                  self._cache_dir)
+                                 for media in medias])
+            for _ in medias:
+                while True:
+                    try:
+                        records = results.next(timeout=0.01)
+                    except multiprocessing.TimeoutError:
+                        yield None
+                    else:
+                        break
+                yield records
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _on_package(self, rpm):
+        """Handle a package found during cache update.
+
+        Add the package to the package cache, updating or creating
+        entries.
         """
 
         # FIXME It's possible that two packages with same VR exists
         #       from different media, we assume that it won't happen.
 
-        rpm = RpmPackage(package_data)
-
-        ## Update package names ...
-        pkgname = self._cache.get(rpm.na)
-        if pkgname is None:
-            # create new pkgname:
-            pkgname = Package(rpm.na, self)
-            self._cache[pkgname.na] = pkgname
-        pkgname.add_version(rpm)
+        self._cache.add_version(rpm)
 
     def _conf_dir_ino_handler(self, event):
         """Configuration directory ionotify event handler."""
@@ -401,10 +810,41 @@ class UrpmiDB(mdvpkg.ConnectableObject):
     def _on_configuration_changed(self):
         log.info('urpmi configuration has changed.')
         self.configure_medias()
+        self._on_db_changed()
 
     def _on_configuration_deleted(self):
         log.info('urpmi configuration has been removed.')
         self._medias = {}
+        self._on_db_changed()
+
+    def _rpmdb_ino_handler(self, event):
+        """rpmdb directory inotify event handler.
+
+        Changes are handled after rpmdb is left unchanged for
+        RPMDB_SETTLE_TIME.
+        """
+        if event.name != 'Packages':
+            return
+        if self._rpmdb_timeout is not None:
+            gobject.source_remove(self._rpmdb_timeout)
+        self._rpmdb_timeout = gobject.timeout_add(RPMDB_SETTLE_TIME,
+                                                  self._on_rpmdb_changed)
+
+    def _on_rpmdb_changed(self):
+        self._rpmdb_timeout = None
+        if not self._ready:
+            # the loader applies it once medias are read:
+            self._rpmdb_pending = True
+            return False
+        self._apply_rpmdb_changes()
+        return False
+
+    def _apply_rpmdb_changes(self):
+        log.info('rpmdb has changed.')
+        changed = self._update_installed_packages()
+        if changed:
+            self._on_db_changed()
+            self._emit_package_changed(sorted(changed))
 
     def _ino_in_callback(self, fd, condition):
         """Inotify gobject io_watch callback."""
@@ -419,81 +859,100 @@ class UrpmiDB(mdvpkg.ConnectableObject):
         self.emit('task-running', task_id)
 
     def on_task_progress(self, task_id, count, total):
+        self._progress.flush()
         self.emit('task-progress', task_id, count, total)
 
     def on_task_done(self, task_id):
+        self._progress.flush()
+        # the task has changed rpmdb:
+        self._on_db_changed()
         self.emit('task-done', task_id)
 
     def on_task_error(self, task_id, message):
         log.debug('task error: %s', message)
+        self._progress.flush()
+        self._on_db_changed()
 
     def on_task_exception(self, task_id, message):
         log.debug('task exception: %s: %s', task_id, message)
 
     def on_download_start(self, task_id, na_evrd):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_download_start(evrd)
+        self._progress.flush()
         self.emit('download-start', task_id, package)
 
     def on_download_progress(self, task_id, na_evrd, percent,
                              total, eta, speed):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_download_progress(evrd, float(percent) / 100.0)
-        self.emit('download-progress',
-                  task_id, package, percent, total, eta, speed)
+        self._progress.push(('download-progress', task_id, na),
+                            'download-progress',
+                            task_id, package, percent, total, eta, speed)
 
     def on_download_end(self, task_id, na_evrd):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_download_done(evrd)
+        self._progress.flush()
         self.emit('download-end', task_id, package)
 
-    def on_download_error(self, na_evrd, message):
-        na, evrd = eval(na_evrd)
+    def on_download_error(self, task_id, na_evrd, message):
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_download_done(evrd)
+        self._progress.flush()
         self.emit('download-error', task_id, package, message)
 
     def on_preparing(self, task_id, total):
+        self._progress.flush()
         self.emit('preparing', task_id, total)
 
     def on_install_start(self, task_id, na_evrd, total, count):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_install_start(evrd)
+        self._progress.flush()
         self.emit('install-start', task_id, package, total, count)
 
     def on_install_progress(self, task_id, na_evrd, amount, total):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_install_progress(evrd, float(amount) / float(total))
-        self.emit('install-progress', task_id, package, amount, total)
+        self._progress.push(('install-progress', task_id, na),
+                            'install-progress',
+                            task_id, package, amount, total)
 
     def on_install_end(self, task_id, na_evrd):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_install_done(evrd)
-        self.emit('package-changed')
+        self._progress.flush()
+        self._emit_package_changed([na])
 
     def on_remove_start(self, task_id, na_evrd, total, count):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_remove_start(evrd)
+        self._progress.flush()
         self.emit('remove-start', task_id, package, total, count)
 
     def on_remove_progress(self, task_id, na_evrd, amount, total):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_remove_progress(evrd, float(amount) / float(total))
-        self.emit('remove-progress', task_id, package, amount, total)
+        self._progress.push(('remove-progress', task_id, na),
+                            'remove-progress',
+                            task_id, package, amount, total)
 
     def on_remove_end(self, task_id, na_evrd):
-        na, evrd = eval(na_evrd)
+        na, evrd = na_evrd
         package = self._cache[na]
         package.on_remove_done(evrd)
-        self.emit('package-changed')
+        self._progress.flush()
+        self._emit_package_changed([na])
 
 
 ACTION_NO_ACTION = 'action-no-action'
@@ -502,6 +961,11 @@ ACTION_AUTO_INSTALL = 'action-auto-install'
 ACTION_REMOVE = 'action-remove'
 ACTION_AUTO_REMOVE = 'action-auto-remove'
 
+## PackageList columns filtered with masks, see mdvpkg.urpmi.columns:
+LIST_COLUMNS = ('name', 'status', 'media', 'group', 'action')
+## ... and columns whose values are counted for the filtered list:
+COUNTED_COLUMNS = ('media', 'group')
+
 
 class PackageList(object):
     """Represent the list of packages in the rpm/urpmi database."""
@@ -510,13 +974,22 @@ class PackageList(object):
         self._urpmi = urpmi
         self._items = {}
         self._names = []
+        self._positions = {}  # { na: index in self._names }
+        # item names in the order of columns rows:
+        self._rows = []
+        self._row_index = {}
+        self._columns = columns.CodedColumns(LIST_COLUMNS)
+        # { column name: { value: count } } in the filtered list:
+        self._filtered_counts = dict((name, {}) for name in COUNTED_COLUMNS)
         self._filters = {}
         self.filter_names = {'name', 'group', 'status', 'media', 'action'}
+        self._key_name = None
         self._reverse = False
         # urpmi transaction to perform actions ...
         self._transaction = None
         # Connect urpmi signals ...
         self._handlers = []
+        self._deleted = False
 
     def __len__(self):
         return len(self._names)
@@ -528,11 +1001,9 @@ class PackageList(object):
         """Initialize the list."""
         # Load package data from urpmi ...
         for pkgname in self._urpmi.list_packages():
-            self._items[pkgname.na] = {
-                'action': ACTION_NO_ACTION,
-                'sort_key': None,
-            }
-            self._names.append(pkgname.na)
+            self._items[pkgname.na] = {'action': ACTION_NO_ACTION}
+        self._rebuild_columns()
+        self._sort_and_filter()
         # Connect to urpmi db signals ...
         for signal, callback in \
                 {'download-start': self._on_download_start,
@@ -550,8 +1021,13 @@ class PackageList(object):
 
     def delete(self):
         """Clean up the list."""
+        self._deleted = True
         self._names = []
+        self._positions = {}
         self._items = {}
+        self._rows = []
+        self._row_index = {}
+        self._columns.rebuild([])
         self._filters = {}
         # Disconnect urpmi signals ...
         while True:
@@ -564,20 +1040,16 @@ class PackageList(object):
 
     def sort(self, key_name, reverse=False):
         """Sort the list of packages using key_name as key."""
-        for na in self._items.iterkeys():
-            item = self._items[na]
-            package = self._urpmi.get_package(na)
-            # Get the sort key value for an item in the list ...
-            if key_name in {'status'}:
-                key = package.status
-            elif key_name in {'action'}:
-                key = item['action']
-            else:
-                key = getattr(package.latest, key_name)
-            self._items[na]['sort_key'] = key
+        self._key_name = key_name
         self._reverse = reverse
         self._sort_and_filter()
 
+    def index_of(self, na):
+        """Return the index of a package in the filtered list, or None
+        if it's filtered out.
+        """
+        return self._positions.get(na)
+
     def get(self, index):
         na = self._names[index]
         package = self._urpmi.get_package(na)
@@ -590,38 +1062,54 @@ class PackageList(object):
                        'progress': package.progress}
         return return_dict
 
-    def remove(self, index):
+    def remove(self, index, reply_handler, error_handler):
+        """Mark the package at index for removal and solve its
+        dependencies, see _solve() for handlers.
+        """
         na = self._names[index]
         pkg = self._urpmi.get_package(na)
         if pkg.has_installs is not True:
             raise ValueError, '%s.%s not installed' % na
         elif pkg.in_progress is not None:
             raise mdvpkg.exceptions.PackageInProgressConflict
-        self._items[na]['action'] = ACTION_REMOVE
-        return self._solve()
+        self._set_action(na, ACTION_REMOVE)
+        self._update_items([na])
+        self._solve(reply_handler, error_handler)
 
-    def install(self, index):
+    def install(self, index, reply_handler, error_handler):
+        """Mark the package at index for installation and solve its
+        dependencies, see _solve() for handlers.
+        """
         na = self._names[index]
         pkg = self._urpmi.get_package(na)
         if pkg.status == 'installed':
             raise ValueError, '%s.%s already installed' % na
         elif pkg.in_progress is not None:
             raise mdvpkg.exceptions.PackageInProgressConflict
-        self._items[na]['action'] = ACTION_INSTALL
-        return self._solve()
+        self._set_action(na, ACTION_INSTALL)
+        self._update_items([na])
+        self._solve(reply_handler, error_handler)
 
-    def no_action(self, index):
+    def no_action(self, index, reply_handler, error_handler):
+        """Unmark the package at index and solve dependencies of the
+        remaining actions, see _solve() for handlers.
+        """
         na = self._names[index]
         item = self._items[na]
         if item['action'] in {ACTION_AUTO_INSTALL, ACTION_AUTO_REMOVE}:
             msg = 'package is required for action: %s' % item['action']
             raise mdvpkg.exceptions.MdvPkgError, msg
-        item['action'] = ACTION_NO_ACTION
-        return self._solve()
+        self._set_action(na, ACTION_NO_ACTION)
+        self._update_items([na])
+        self._solve(reply_handler, error_handler)
+
+    def _solve(self, reply_handler, error_handler):
+        """Select all packages with actions and solve dependencies
+        updating actions.
 
-    def _solve(self):
-        """Select all packages with actions, solve dependencies
-        updating actions.  Return lists of selections and rejections.
+        The resolution runs asynchronously, reply_handler is called
+        with lists of selections and rejections when it's done, or
+        error_handler with an exception.
         """
         installs = []
         removes = []
@@ -633,14 +1121,37 @@ class PackageList(object):
             elif item['action'] == ACTION_REMOVE:
                 removes.append(na)
             if item['action'] != ACTION_NO_ACTION:
-                items_with_actions.append(item)
+                items_with_actions.append(na)
+
+        def on_resolved(action_list, reject_list):
+            if self._deleted:
+                error_handler(
+                    mdvpkg.exceptions.MdvPkgError('list was deleted')
+                )
+                return
+            try:
+                actions = self._on_solved(items_with_actions,
+                                          action_list,
+                                          reject_list)
+            except Exception as e:
+                log.exception('failed to apply resolution')
+                error_handler(e)
+            else:
+                reply_handler(*actions)
 
-        action_list, reject_list \
-            = self._urpmi.resolve_deps(installs=installs,
-                                       removes=removes)
+        self._urpmi.resolve_deps(installs, removes,
+                                 on_resolved, error_handler)
+
+    def _on_solved(self, items_with_actions, action_list, reject_list):
+        """Update actions from a resolution.  Return lists of
+        selections and rejections.
+        """
+        changed = set()
         if not reject_list:
-            for item in items_with_actions:
-                item['action'] = ACTION_NO_ACTION
+            for na in items_with_actions:
+                if na in self._items:
+                    self._set_action(na, ACTION_NO_ACTION)
+                    changed.add(na)
 
         installs_rej = []
         removes_rej = []
@@ -661,13 +1172,14 @@ class PackageList(object):
                 rpm = self._urpmi.get_package(na)[evrd]
                 if not reject_list:
                     log.debug('action changed for %s: %s', rpm, action)
-                    self._items[na]['action'] = action
+                    self._set_action(na, action)
+                    changed.add(na)
                 if action in {ACTION_INSTALL, ACTION_AUTO_INSTALL}:
                     installs_fn.append(rpm)
                 elif action in {ACTION_REMOVE, ACTION_AUTO_REMOVE}:
                     removes_fn.append(rpm)
 
-        self._sort_and_filter()
+        self._update_items(changed)
 
         return installs_fn, removes_fn, installs_rej, removes_rej
 
@@ -689,54 +1201,46 @@ class PackageList(object):
                 auto_removes.append(na)
         if not installs and not removes:
             raise ValueError('no action was selected')
-        for in_progress, na_list in zip(['installing', 'installing',
-                                             'removing', 'removing'],
-                                        [installs, auto_installs,
-                                             removes, auto_removes]):
-            for na in na_list:
-                self._items[na]['action'] = ACTION_NO_ACTION
-                pkg = self._urpmi.get_package(na)
-                pkg.in_progress = in_progress
-                pkg.progress = 0.0
-        self._sort_and_filter()
+        for na in installs + auto_installs + removes + auto_removes:
+            self._set_action(na, ACTION_NO_ACTION)
+        # list positions are updated by package-changed:
+        self._urpmi.mark_in_progress(installs + auto_installs,
+                                     removes + auto_removes)
         return self._urpmi.run_task(install=installs, remove=removes)
 
+    def search(self, text):
+        """Return the list of indexes of filtered packages whose names
+        and summaries match text, in rank order, see
+        mdvpkg.urpmi.index.SearchIndex.search().
+        """
+        ranks = dict((name, rank) for rank, name
+                         in enumerate(self._urpmi.search_index.search(text)))
+        if not ranks:
+            return []
+        results = [(ranks[na[0]], i) for i, na in enumerate(self._names)
+                       if na[0] in ranks]
+        results.sort()
+        return [i for _, i in results]
+
     def get_medias(self):
         """Return the list of medias of filtered packages."""
-        return self._count_medias(self._names)
+        return set(self._filtered_counts['media'])
 
     def get_all_medias(self):
         """Return the list of medias of filtered packages."""
-        return self._count_medias(self._items.iterkeys())
+        return set(self._columns.counts('media'))
 
     def get_groups(self):
         """Return the dict of package groups and package count in
         the filtered list.
         """
-        return self._count_groups(self._names)
+        return dict(self._filtered_counts['group'])
 
     def get_all_groups(self):
         """Return the dict of packages groups and package count in the
         unfiltered list.
         """
-        return self._count_groups(self._items.iterkeys())
-
-    def _count_medias(self, na_iter):
-        medias = set()
-        for na in na_iter:
-            medias.add(self._urpmi.get_package(na).latest.media)
-        return medias
-
-    def _count_groups(self, na_iter):
-        groups_dict = {}
-        for na in na_iter:
-            group = self._urpmi.get_package(na).latest.group
-            count = groups_dict.get(group)
-            if count is None:
-                groups_dict[group] = 1
-            else:
-                groups_dict[group] += 1
-        return groups_dict
+        return self._columns.counts('group')
 
     def __getattr__(self, name):
         """Look for filter calls (self.filter_NAME) or ignore."""
@@ -763,45 +1267,191 @@ class PackageList(object):
             self._filters[name] = filter
 
     def _sort_and_filter(self):
-        """Sort and filter the key list."""
-        self._names = []
-        for na in self._items:
-            if self._filter(na):
-                self._names.append(na)
-        self._names.sort(key=lambda na: self._items[na]['sort_key'],
-                         reverse=self._reverse)
+        """Sort and filter the key list.
+
+        This rebuilds the whole list, it's needed when filters or the
+        sort key change.  Items whose action or status changed are
+        moved by _update_items().
+        """
+        mask = self._filter_mask()
+        if mask is None:
+            for name in COUNTED_COLUMNS:
+                self._filtered_counts[name] = self._columns.counts(name)
+        else:
+            indexes = columns.mask_indexes(mask)
+            for name in COUNTED_COLUMNS:
+                self._filtered_counts[name] \
+                    = self._columns.count_rows(name, indexes)
+        if self._key_name == 'action':
+            # actions are per list, sort the filtered items:
+            if mask is None:
+                self._names = list(self._rows)
+            else:
+                self._names = [self._rows[i] for i in indexes]
+            self._names.sort(key=self._sort_tuple, reverse=self._reverse)
+        else:
+            # filter the order shared by all lists sorted by this key:
+            order = self._urpmi.sort_order(self._key_name)
+            if self._reverse:
+                order = reversed(order)
+            row_index = self._row_index
+            if mask is None:
+                self._names = [na for na in order if na in row_index]
+            else:
+                passes = columns.mask_to_list(mask)
+                self._names = [na for na in order
+                                   if na in row_index
+                                       and passes[row_index[na]]]
+        self._positions = dict((na, i) for i, na in enumerate(self._names))
+
+    def _update_items(self, nas):
+        """Update the rows of items and move them to their sorted
+        position in the filtered list, or out of it.
+        """
+        nas = set(nas)
+        # take items out from the end of the list, so positions of the
+        # others are still valid ...
+        removed = sorted(((self._positions.pop(na), na) for na in nas
+                              if na in self._positions),
+                         reverse=True)
+        first = len(self._names)
+        for position, na in removed:
+            del self._names[position]
+            self._count_row(self._row_index[na], -1)
+            first = position
+        # ... and insert them back at their new positions:
+        for na in nas:
+            row_index = self._row_index[na]
+            self._columns.set_row(row_index, self._row(na))
+            if self._row_passes(row_index):
+                position = self._bisect(self._sort_tuple(na))
+                self._names.insert(position, na)
+                self._positions[na] = position
+                self._count_row(row_index, 1)
+                first = min(first, position)
+        for i in xrange(first, len(self._names)):
+            self._positions[self._names[i]] = i
+
+    def _bisect(self, key):
+        """Return the position to insert a sort key in the filtered
+        list.
+        """
+        lo = 0
+        hi = len(self._names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._sort_tuple(self._names[mid])
+            if self._reverse:
+                before = mid_key > key
+            else:
+                before = mid_key < key
+            if before:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _sort_tuple(self, na):
+        # names break ties, so positions can be found by bisection:
+        if self._key_name == 'action':
+            return (self._items[na]['action'], na)
+        return (package_sort_key(self._urpmi.get_package(na),
+                                 self._key_name),
+                na)
+
+    def _count_row(self, row_index, delta):
+        """Add delta to the filtered counts of the values of a row."""
+        for name in COUNTED_COLUMNS:
+            counts = self._filtered_counts[name]
+            value = self._columns.get(name, row_index)
+            count = counts.get(value, 0) + delta
+            if count:
+                counts[value] = count
+            else:
+                del counts[value]
 
-    def _filter(self, na):
+    def _row_passes(self, row_index):
+        """Check if a row passes all filters."""
         for filter_name, sets in self._filters.iteritems():
-            for exclude in sets:
-                matches = self._filters[filter_name][exclude]
-                match_func = getattr(self,
-                                     '_%s_match_func' % filter_name)
-                if not exclude ^ match_func(na, matches):
+            value = self._columns.get(filter_name, row_index)
+            value_match = getattr(self, '_%s_match_value' % filter_name)
+            for exclude, matches in sets.iteritems():
+                if value_match(matches, value) == exclude:
                     return False
         return True
 
-    def _name_match_func(self, na, matches):
-        for name in matches:
-            if re.match(name, self._urpmi.get_package(na).name):
-                return True
-        return False
+    def _filter_mask(self):
+        """Return the mask of rows passing all filters, or None if
+        there are no filters.
+        """
+        mask = None
+        for filter_name, sets in self._filters.iteritems():
+            match_mask = getattr(self, '_%s_match_mask' % filter_name)
+            for exclude, matches in sets.iteritems():
+                filter_mask = match_mask(matches)
+                if exclude:
+                    filter_mask = columns.mask_not(filter_mask)
+                if mask is None:
+                    mask = filter_mask
+                else:
+                    mask = columns.mask_and(mask, filter_mask)
+        return mask
 
-    def _status_match_func(self, na, matches):
-        return self._urpmi.get_package(na).status in matches
+    def _name_match_mask(self, matches):
+        name_index = self._urpmi.name_index
+        names = set()
+        for pattern in matches:
+            names.update(name_index.match(pattern))
+        return self._columns.match_values('name', names)
 
-    def _group_match_func(self, na, matches):
-        folders = self._urpmi.get_package(na).latest.group.split('/')
-        for i in range(1, len(folders) + 1):
-            if '/'.join(folders[:i]) in matches:
-                return True
-        return False
+    def _status_match_mask(self, matches):
+        return self._columns.match('status', matches.__contains__)
 
-    def _media_match_func(self, na, matches):
-        return self._urpmi.get_package(na).latest.media in matches
+    def _group_match_mask(self, matches):
+        group_tree = self._urpmi.group_tree
+        groups = set()
+        for prefix in matches:
+            groups.update(group_tree.groups_under(prefix))
+        return self._columns.match_values('group', groups)
 
-    def _action_match_func(self, na, matches):
-        return self._items[na]['action'] in matches
+    def _media_match_mask(self, matches):
+        return self._columns.match('media', matches.__contains__)
+
+    def _action_match_mask(self, matches):
+        return self._columns.match('action', matches.__contains__)
+
+    def _name_match_value(self, matches, name):
+        return any(re.match(pattern, name) for pattern in matches)
+
+    def _group_match_value(self, matches, group):
+        return not matches.isdisjoint(index.group_prefixes(group))
+
+    def _status_match_value(self, matches, status):
+        return status in matches
+
+    _media_match_value = _status_match_value
+    _action_match_value = _status_match_value
+
+    def _set_action(self, na, action):
+        """Set the action of an item, its row and position are updated
+        by _update_items().
+        """
+        self._items[na]['action'] = action
+
+    def _row(self, na):
+        """Return the tuple of LIST_COLUMNS values of an item."""
+        package = self._urpmi.get_package(na)
+        latest = package.latest
+        return (package.name,
+                package.status,
+                latest.media,
+                latest.group,
+                self._items[na]['action'])
+
+    def _rebuild_columns(self):
+        self._rows = list(self._items)
+        self._row_index = dict((na, i) for i, na in enumerate(self._rows))
+        self._columns.rebuild([self._row(na) for na in self._rows])
 
     #
     # Signal callbacks
@@ -835,5 +1485,23 @@ class PackageList(object):
     def _on_remove_progress(self, task_id, package, amount, total):
         pass
 
-    def _on_package_changed(self):
-        self._sort_and_filter()
+    def _on_package_changed(self, na_list):
+        """Add new packages to the list and drop the ones removed from
+        the package cache.
+        """
+        rebuild = False
+        for na in na_list:
+            try:
+                self._urpmi.get_package(na)
+            except KeyError:
+                if self._items.pop(na, None) is not None:
+                    rebuild = True
+            else:
+                if na not in self._items:
+                    self._items[na] = {'action': ACTION_NO_ACTION}
+                    rebuild = True
+        if rebuild:
+            self._rebuild_columns()
+            self._sort_and_filter()
+        else:
+            self._update_items([na for na in na_list if na in self._items])
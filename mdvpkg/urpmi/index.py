@@ -0,0 +1,248 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Search indexes over the package cache.
+
+Indexes are built from the package cache and are rebuilt by UrpmiDB
+when its generation changes.
+"""
+
+
+import re
+import array
+import bisect
+
+
+## Characters making a name filter pattern a regular expression:
+_REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+## Maximum number of compiled name patterns kept by an index:
+REGEX_CACHE_SIZE = 64
+
+
+def parse_name_pattern(pattern):
+    """Return a (kind, literal) tuple for a name filter pattern, as
+    matched by re.match().  kind is 'prefix' or 'substring' for
+    patterns equivalent to those queries on literal, or 'regex'.
+    """
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    kind = 'prefix'
+    if pattern.startswith('.*'):
+        pattern = pattern[2:]
+        kind = 'substring'
+    if pattern.endswith('.*') and not pattern.endswith('\\.*'):
+        pattern = pattern[:-2]
+    if _REGEX_CHARS.isdisjoint(pattern):
+        return kind, pattern
+    return 'regex', None
+
+
+class NameIndex(object):
+    """Index of package names, with the sorted list of names for
+    prefix queries and a trigram index for substring queries.
+    """
+
+    def __init__(self, names):
+        self._names = sorted(set(names))
+        self._trigrams = {}  # { trigram: array of name positions }
+        for i, name in enumerate(self._names):
+            for trigram in set(name[j:j + 3]
+                                   for j in range(len(name) - 2)):
+                positions = self._trigrams.get(trigram)
+                if positions is None:
+                    positions = array.array('i')
+                    self._trigrams[trigram] = positions
+                positions.append(i)
+        self._regexes = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def match(self, pattern):
+        """Return the list of names matched by a name filter
+        pattern.
+        """
+        kind, literal = parse_name_pattern(pattern)
+        if kind == 'prefix':
+            return self.prefix(literal)
+        elif kind == 'substring':
+            return self.substring(literal)
+        regex = self._regexes.get(pattern)
+        if regex is None:
+            if len(self._regexes) >= REGEX_CACHE_SIZE:
+                self._regexes.clear()
+            regex = re.compile(pattern)
+            self._regexes[pattern] = regex
+        return [name for name in self._names if regex.match(name)]
+
+    def prefix(self, prefix):
+        """Return the list of names starting with prefix."""
+        names = []
+        for i in xrange(bisect.bisect_left(self._names, prefix),
+                        len(self._names)):
+            name = self._names[i]
+            if not name.startswith(prefix):
+                break
+            names.append(name)
+        return names
+
+    def substring(self, substring):
+        """Return the list of names containing substring."""
+        if len(substring) < 3:
+            return [name for name in self._names if substring in name]
+        postings = []
+        for j in range(len(substring) - 2):
+            positions = self._trigrams.get(substring[j:j + 3])
+            if positions is None:
+                return []
+            postings.append(positions)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            candidates.intersection_update(positions)
+            if not candidates:
+                return []
+        return [self._names[i] for i in sorted(candidates)
+                    if substring in self._names[i]]
+
+
+## Words of search queries, names and summaries:
+_TOKEN_RE = re.compile('[a-z0-9]+')
+
+## Search result ranks, a name equal to the query ranks first, then
+## names starting with it, then names and summaries containing its
+## terms ...
+RANK_NAME_EXACT = 2
+RANK_NAME_PREFIX = 1
+RANK_TERMS = 0
+
+
+def tokenize(text):
+    """Return the list of lower case words of a text."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex(object):
+    """Inverted index of the words in package names and summaries."""
+
+    def __init__(self, summaries):
+        """Build the index from (name, summary) pairs."""
+        self._names = []
+        self._name_ids = {}
+        self._postings = {}  # { token: array of name ids, per use }
+        for name, summary in summaries:
+            if name in self._name_ids:
+                continue
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+            for token in tokenize(name) + tokenize(summary or ''):
+                positions = self._postings.get(token)
+                if positions is None:
+                    positions = array.array('i')
+                    self._postings[token] = positions
+                positions.append(name_id)
+        self._tokens = sorted(self._postings)
+
+    def search(self, text):
+        """Return the list of package names matching all words of
+        text, in rank order.
+
+        Names are ranked by RANK_* and then by the number of
+        occurrences of the query words in the name and summary.  The
+        last word also matches words it's a prefix of, so queries can
+        be run as they're typed.
+        """
+        terms = tokenize(text)
+        if not terms:
+            return []
+        scores = None
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                tokens = self._expand_prefix(term)
+            else:
+                tokens = [term] if term in self._postings else []
+            term_scores = {}
+            for token in tokens:
+                for name_id in self._postings[token]:
+                    term_scores[name_id] = term_scores.get(name_id, 0) + 1
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = dict((name_id, scores[name_id] + score)
+                                  for name_id, score
+                                      in term_scores.iteritems()
+                                  if name_id in scores)
+            if not scores:
+                return []
+        query = text.strip().lower()
+        results = []
+        for name_id, score in scores.iteritems():
+            name = self._names[name_id]
+            lower_name = name.lower()
+            if lower_name == query:
+                rank = RANK_NAME_EXACT
+            elif lower_name.startswith(query):
+                rank = RANK_NAME_PREFIX
+            else:
+                rank = RANK_TERMS
+            results.append((-rank, -score, name))
+        results.sort()
+        return [name for _, _, name in results]
+
+    def _expand_prefix(self, prefix):
+        """Return the indexed tokens starting with prefix."""
+        tokens = []
+        for i in xrange(bisect.bisect_left(self._tokens, prefix),
+                        len(self._tokens)):
+            token = self._tokens[i]
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+
+
+def group_prefixes(group):
+    """Return the list of prefixes of a group path, from the top level
+    folder to the group itself.
+    """
+    folders = group.split('/')
+    return ['/'.join(folders[:i]) for i in range(1, len(folders) + 1)]
+
+
+class GroupTree(object):
+    """Index of package groups, mapping each group path prefix to the
+    groups under it.
+    """
+
+    def __init__(self, groups):
+        """Build the tree from the groups of packages."""
+        self._groups = {}  # { group prefix: set of groups }
+        for group in set(groups):
+            for prefix in group_prefixes(group):
+                self._groups.setdefault(prefix, set()).add(group)
+
+    def groups_under(self, prefix):
+        """Return the set of groups in the folder prefix, including
+        prefix itself if it's a group.
+        """
+        return self._groups.get(prefix, frozenset())
@@ -23,11 +23,30 @@
 """Class for accessing urpmi media data."""
 
 
+import os
 import os.path
 import re
 import gzip
+import marshal
+import hashlib
+import tempfile
+import logging
 import gobject
 
+from mdvpkg.urpmi.packages import intern_fields
+
+
+log = logging.getLogger('mdvpkgd.urpmi')
+
+## Format version of synthesis cache files, it must be bumped every
+## time the record layout changes ...
+CACHE_VERSION = 1
+
+## Package record fields, in the order they're stored in records
+## returned by UrpmiMedia.list_records() ...
+RECORD_FIELDS = ('name', 'version', 'release', 'arch', 'epoch', 'size',
+                 'group', 'summary', 'disttag', 'distepoch')
+
 
 class UrpmiMedia(gobject.GObject):
     """Provide access to a urpmi media data."""
@@ -35,8 +54,10 @@ class UrpmiMedia(gobject.GObject):
     def __init__(self, name, mediadict,
                  data_dir='/var/lib/urpmi',
                  key='',
-                 compressed=True):
+                 compressed=True,
+                 cache_dir=None):
         self.name = name
+        self.config = mediadict
         self.ignore = mediadict.get('ignore', False)
         self.update = mediadict.get('update', False)
         self.key_ids = mediadict.get('keys-ids', '')
@@ -49,6 +70,13 @@ class UrpmiMedia(gobject.GObject):
             data_dir,
             '%s/synthesis.hdlist.cz' % name
         )
+        if cache_dir is not None:
+            self._cache_path = os.path.join(
+                cache_dir,
+                '%s.synthesis.cache' % name.replace('/', '_')
+            )
+        else:
+            self._cache_path = None
 
         # name-version-release.arch regexp:
         self._nvra_re = re.compile('^(?P<name>.+)-'
@@ -61,7 +89,49 @@ class UrpmiMedia(gobject.GObject):
                                       ' *(?P<ver>.*)])?')
 
     def list(self):
-        """Open the hdlist file and yields package data in it."""
+        """Yield the data of each package in the media as a dict."""
+        for record in self.list_records():
+            yield intern_fields(dict(zip(RECORD_FIELDS, record)))
+
+    def list_records(self):
+        """Return the list of package records of the media.
+
+        Records are tuples with values for RECORD_FIELDS.  They are
+        loaded from the synthesis cache if it's still valid for the
+        hdlist file, otherwise the hdlist is parsed and the cache is
+        rebuilt.
+        """
+        return [record for record in self.iter_records()
+                       if record is not None]
+
+    def iter_records(self):
+        """Yield the package records of the media, as list_records()
+        does, and None while the hdlist file is being checksummed.
+
+        Callers running in the main loop may return control to it
+        each time something is yielded.
+        """
+        if self._cache_path is None:
+            for record in self._parse_hdlist():
+                yield record
+            return
+        for key in self._iter_hdlist_key():
+            if key is None:
+                yield None
+        records = self._read_cache(key)
+        if records is not None:
+            for record in records:
+                yield record
+            return
+        log.debug('synthesis cache of %s is outdated', self.name)
+        records = []
+        for record in self._parse_hdlist():
+            records.append(record)
+            yield record
+        self._write_cache(key, records)
+
+    def _parse_hdlist(self):
+        """Open the hdlist file and yield package records in it."""
         with self._open(self._hdlist_path, 'r') as hdlist:
             pkg = {}
             for line in hdlist:
@@ -69,8 +139,8 @@ class UrpmiMedia(gobject.GObject):
                 tag = fields[0]
                 if tag == 'info':
                     try:
-			pkg['disttag'] = fields[5]
-			pkg['distepoch'] = fields[6]
+                        pkg['disttag'] = fields[5]
+                        pkg['distepoch'] = fields[6]
                     except IndexError:
                         pass
                     pkg.update(zip(('name', 'version', 'release', 'arch'),
@@ -81,7 +151,7 @@ class UrpmiMedia(gobject.GObject):
                                    )))
                     for (i, field) in enumerate(('epoch', 'size', 'group')):
                         pkg[field] = fields[2 + i]
-                    yield pkg
+                    yield tuple([pkg.get(field) for field in RECORD_FIELDS])
                     pkg = {}
                 elif tag == 'summary':
                     pkg['summary'] = fields[1]
@@ -92,6 +162,57 @@ class UrpmiMedia(gobject.GObject):
                     # pkg[tag] = self._parse_capability_list(fields[1:])
                     pass
 
+    def _hdlist_key(self):
+        """Return the (size, mtime, digest) tuple identifying the
+        current contents of the hdlist file.
+        """
+        for key in self._iter_hdlist_key():
+            pass
+        return key
+
+    def _iter_hdlist_key(self):
+        """Yield None after each chunk of the hdlist file is digested,
+        and then its key, see _hdlist_key().
+        """
+        stat = os.stat(self._hdlist_path)
+        digest = hashlib.md5()
+        with open(self._hdlist_path, 'rb') as hdlist:
+            while True:
+                chunk = hdlist.read(65536)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                yield None
+        yield (stat.st_size, int(stat.st_mtime), digest.hexdigest())
+
+    def _read_cache(self, key):
+        """Return records from the cache file or None if it's missing
+        or doesn't match key.
+        """
+        try:
+            with open(self._cache_path, 'rb') as cache:
+                version, cache_key, records = marshal.load(cache)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if version != CACHE_VERSION or cache_key != key:
+            return None
+        return records
+
+    def _write_cache(self, key, records):
+        """Atomically replace the cache file with records."""
+        cache_dir = os.path.dirname(self._cache_path)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'wb') as cache:
+                marshal.dump((CACHE_VERSION, key, records), cache)
+            os.rename(temp_path, self._cache_path)
+        except (IOError, OSError) as e:
+            log.warning('could not write synthesis cache of %s: %s',
+                        self.name,
+                        e)
+
     def parse_rpm_name(self, name, disttag=None, distepoch=None):
         """Return (name, version, release, arch) tuple from a rpm
         package name.
@@ -21,13 +21,92 @@
 ##
 """Classes and functions for rpm package representations."""
 
-import rpm
+import re
 import logging
 import bisect
 
 
 log = logging.getLogger('mdvpkgd.urpmi')
 
+## Package fields with few distinct values, shared between packages
+## by intern_fields() ...
+INTERNED_FIELDS = ('arch', 'group', 'media', 'disttag', 'distepoch')
+
+## Capabilities of packages without capabilities information:
+_NO_CAPABILITIES = ()
+
+
+def intern_string(value):
+    """Return the shared copy of a low cardinality string field."""
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+def intern_fields(pkgdict):
+    """Replace INTERNED_FIELDS values in a package dict by their shared
+    copies.
+    """
+    for field in INTERNED_FIELDS:
+        if field in pkgdict:
+            pkgdict[field] = intern_string(pkgdict[field])
+    return pkgdict
+
+
+## rpmvercmp() segments: tilde, alphabetic or numeric runs, anything
+## else is a separator ...
+_SEGMENT_RE = re.compile('(~)|([a-zA-Z]+)|([0-9]+)')
+
+## Segment keys ordering: a tilde sorts before the end of the version
+## string, which sorts before any other segment, and alphabetic
+## segments sort before numeric ones ...
+_TILDE_KEY = (-1,)
+_END_KEY = (0,)
+_ALPHA = 1
+_NUMERIC = 2
+
+## version_key() of version strings, so EVRDs with equal versions,
+## releases or distepochs share their keys ...
+_version_keys = {}
+
+
+def version_key(version):
+    """Return a tuple ordering version strings as rpmvercmp() does.
+
+    Each segment of the version is keyed by its kind and value, and
+    the key ends with _END_KEY, so versions with more segments sort
+    after their prefixes unless the extra segment is a tilde.
+    """
+    version = version or ''
+    key = _version_keys.get(version)
+    if key is None:
+        key = _build_version_key(version)
+        _version_keys[version] = key
+    return key
+
+
+def _build_version_key(version):
+    key = []
+    for tilde, alpha, numeric in _SEGMENT_RE.findall(version):
+        if tilde:
+            key.append(_TILDE_KEY)
+        elif alpha:
+            key.append((_ALPHA, alpha))
+        else:
+            key.append((_NUMERIC, int(numeric)))
+    key.append(_END_KEY)
+    return tuple(key)
+
+
+def evrd_key(epoch, version, release, distepoch):
+    """Return the sort key of an epoch, version, release and
+    distepoch, a missing distepoch sorts as an empty one.
+    """
+    return (int(epoch or 0),
+            version_key(version),
+            version_key(release),
+            version_key(distepoch))
+
 
 def create_evrd(evrd_data):
     """Create a RpmEVRD object from dictionaries and iterables."""
@@ -47,16 +126,44 @@ def create_evrd(evrd_data):
 
 
 class RpmEVRD(object):
-    """Represents a EVR + Distepoch of a RPM package."""
+    """Represents a EVR + Distepoch of a RPM package.
+
+    EVRDs are ordered by their key, see evrd_key().  Unlike rpm, which
+    ignores distepochs unless both EVRDs have one, a missing distepoch
+    sorts before any other: rpm's ordering is not transitive and can't
+    be a sort key.
+    """
+
+    __slots__ = ('epoch', 'version', 'release', 'distepoch', 'key')
 
     def __init__(self, pkgdict):
         self.epoch = int(pkgdict.get('epoch', 0))
         self.version = pkgdict['version']
         self.release = pkgdict['release']
-        self.distepoch = pkgdict.get('distepoch')
+        self.distepoch = intern_string(pkgdict.get('distepoch'))
+        self.key = evrd_key(self.epoch,
+                            self.version,
+                            self.release,
+                            self.distepoch)
+
+    @classmethod
+    def from_values(cls, epoch, version, release, distepoch=None,
+                    key=None):
+        """Create a EVRD without an intermediate package dict, key is
+        its evrd_key() if already known.
+        """
+        evrd = cls.__new__(cls)
+        evrd.epoch = int(epoch or 0)
+        evrd.version = version
+        evrd.release = release
+        evrd.distepoch = intern_string(distepoch)
+        if key is None:
+            key = evrd_key(evrd.epoch, version, release, distepoch)
+        evrd.key = key
+        return evrd
 
     def __cmp__(self, other):
-        return rpm.evrCompare(self.__repr__(), other.__repr__())
+        return cmp(self.key, other.key)
 
     def __hash__(self):
         return (self.epoch,
@@ -76,16 +183,20 @@ class RpmPackage(object):
     data.
     """
 
+    __slots__ = ('name', 'arch', 'group', 'summary', 'size', 'evrd',
+                 'disttag', 'media', 'installtime', 'requires', 'provides',
+                 'conflict', 'obsoletes')
+
     def __init__(self, pkgdict):
         self.name = pkgdict['name']
-        self.arch = pkgdict['arch']
-        self.group = pkgdict['group']
+        self.arch = intern_string(pkgdict['arch'])
+        self.group = intern_string(pkgdict['group'])
         self.summary = pkgdict['summary']
         self.size = int(pkgdict['size'])
 
         self.evrd = RpmEVRD(pkgdict)
-        self.disttag = pkgdict.get('disttag')
-        self.media = pkgdict.get('media')
+        self.disttag = intern_string(pkgdict.get('disttag'))
+        self.media = intern_string(pkgdict.get('media'))
         self.installtime = pkgdict.get('installtime')
         # FIXME Currently installed packages won't come with
         #       capabilities information:
@@ -94,6 +205,34 @@ class RpmPackage(object):
         self.conflict = pkgdict.get('conflict', [])
         self.obsoletes = pkgdict.get('obsoletes', [])
 
+    @classmethod
+    def from_record(cls, record, media=None, installtime=None,
+                    evrd=None):
+        """Create a package from a record tuple, with fields ordered as
+        in mdvpkg.urpmi.media.RECORD_FIELDS, without an intermediate
+        package dict.  evrd is the RpmEVRD of the record if already
+        known.
+        """
+        (name, version, release, arch, epoch, size,
+         group, summary, disttag, distepoch) = record
+        package = cls.__new__(cls)
+        package.name = name
+        package.arch = intern_string(arch)
+        package.group = intern_string(group)
+        package.summary = summary
+        package.size = int(size)
+        if evrd is None:
+            evrd = RpmEVRD.from_values(epoch, version, release, distepoch)
+        package.evrd = evrd
+        package.disttag = intern_string(disttag)
+        package.media = intern_string(media)
+        package.installtime = installtime
+        package.requires = _NO_CAPABILITIES
+        package.provides = _NO_CAPABILITIES
+        package.conflict = _NO_CAPABILITIES
+        package.obsoletes = _NO_CAPABILITIES
+        return package
+
     @property
     def distepoch(self):
         return self.evrd.distepoch
@@ -170,6 +309,7 @@ class Package(object):
         self.na = na
         self.urpmi = urpmi
         self._versions = {}  # { rpm.evrd: {'rpm': RPM, 'type': TYPE} }
+        # sorted lists of evrds by type:
         self._types = {'installed': [],
                        'upgrade': [],
                        'downgrade': []}
@@ -284,11 +424,56 @@ class Package(object):
             elif rpm.installtime is not None:
                 rpm.media = version_dict['rpm'].media
                 version_dict['rpm'] = rpm
+                self._set_latest_installed(rpm)
                 self._set_type(version_dict, 'installed')
             else:
                 version_dict['rpm'] = rpm
                 self._set_type(version_dict, self._get_update_type(rpm))
        
+    @property
+    def is_empty(self):
+        """True if there are no versions left of this package."""
+        return not self._versions
+
+    def add_installed(self, rpm):
+        """Add a version found installed in rpmdb."""
+        version_dict = self._versions.get(rpm.evrd)
+        if version_dict is not None:
+            if version_dict['type'] == 'installed':
+                return
+            rpm.media = version_dict['rpm'].media
+            version_dict['rpm'] = rpm
+        else:
+            version_dict = {'rpm': rpm}
+            self._versions[rpm.evrd] = version_dict
+        self._set_latest_installed(rpm)
+        self._set_type(version_dict, 'installed')
+
+    def remove_installed(self, evrd):
+        """Remove a version found removed from rpmdb, keeping it as an
+        update if it's available in a media.
+        """
+        version_dict = self._versions.get(evrd)
+        if version_dict is None or version_dict['type'] != 'installed':
+            return
+        rpm = version_dict['rpm']
+        self._remove_from_type('installed', evrd)
+        if rpm.media is None:
+            del self._versions[evrd]
+        else:
+            rpm.installtime = None
+            del version_dict['type']
+            self._set_type(version_dict, self._get_update_type(rpm))
+        self._update_types()
+
+    def _update_types(self):
+        """Reclassify updates after the installed versions changed."""
+        for type in ('upgrade', 'downgrade'):
+            for version_dict in self._list_by_type(type):
+                new_type = self._get_update_type(version_dict['rpm'])
+                if new_type != type:
+                    self._set_type(version_dict, new_type)
+
     def update(self, other):
         """Update our version list from another package's version
         list.
@@ -348,8 +533,8 @@ class Package(object):
         self.progress = 0.5
         log.debug('downloaded %s-%s-%s.%s',
                   self.name,
-                  evrd['version'],
-                  evrd['release'],
+                  evrd.version,
+                  evrd.release,
                   self.arch)
 
     def on_install_start(self, evrd):
@@ -378,8 +563,8 @@ class Package(object):
         self._set_type(version, 'installed')
         log.debug('installed %s-%s-%s.%s',
                   self.name,
-                  evrd['version'],
-                  evrd['release'],
+                  evrd.version,
+                  evrd.release,
                   self.arch)
 
     def on_remove_start(self, evrd):
@@ -409,8 +594,8 @@ class Package(object):
         self._set_type(version, new_type)
         log.debug('removed %s-%s-%s.%s',
                   self.name,
-                  evrd['version'],
-                  evrd['release'],
+                  evrd.version,
+                  evrd.release,
                   self.arch)
 
     def _get_version(self, key):
@@ -439,17 +624,24 @@ class Package(object):
 
     def _latest_by_type(self, type):
         """Return the latest package of specified type."""
-        evrd = sorted(self._types[type])[-1]
+        evrd = self._types[type][-1]
         return self._versions[evrd]['rpm']
 
     def _set_type(self, version_dict, type):
         rpm = version_dict['rpm']
         old_type = version_dict.get('type')
         if old_type is not None:
-            self._types[old_type].remove(rpm.evrd)
-        self._types[type].append(rpm.evrd)
+            self._remove_from_type(old_type, rpm.evrd)
+        bisect.insort(self._types[type], rpm.evrd)
         version_dict['type'] = type
 
+    def _remove_from_type(self, type, evrd):
+        evrds = self._types[type]
+        i = bisect.bisect_left(evrds, evrd)
+        if i == len(evrds) or evrds[i] != evrd:
+            raise ValueError, 'not a version of type %s: %s' % (type, evrd)
+        del evrds[i]
+
     def _get_update_type(self, rpm):
         if not self.has_installs or rpm > self.latest_installed:
             return 'upgrade'
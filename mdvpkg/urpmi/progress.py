@@ -0,0 +1,73 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Rate limiting of task progress signals."""
+
+
+import collections
+import gobject
+
+
+class ProgressCoalescer(object):
+    """Deliver progress events at most rate times per second, keeping
+    only the latest event of each key in between.
+
+    The first event after a quiet period is delivered at once, the
+    next ones when the rate allows it.  Callers must flush() pending
+    events before delivering events that are not coalesced, so they
+    are seen in order.
+    """
+
+    def __init__(self, callback, rate=10):
+        """Call callback with the arguments of coalesced events; a rate
+        of 0 delivers all events at once.
+        """
+        self._callback = callback
+        if rate:
+            self._interval = max(1, int(1000 / rate))
+        else:
+            self._interval = None
+        self._pending = collections.OrderedDict()  # { key: args }
+        self._timeout = None
+
+    def push(self, key, *args):
+        """Queue an event, replacing the pending event of key."""
+        if self._interval is None:
+            self._callback(*args)
+        elif self._timeout is None:
+            self._callback(*args)
+            self._timeout = gobject.timeout_add(self._interval,
+                                                self._on_timeout)
+        else:
+            self._pending[key] = args
+
+    def flush(self):
+        """Deliver pending events."""
+        while self._pending:
+            _, args = self._pending.popitem(last=False)
+            self._callback(*args)
+
+    def _on_timeout(self):
+        if self._pending:
+            self.flush()
+            return True
+        self._timeout = None
+        return False
@@ -0,0 +1,108 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Decoding of urpmi backends responses.
+
+Backends respond with lines of tab separated fields.  Packages are
+defined once by a package definition response, with an id followed
+by name, arch, epoch, version, release and distepoch, and later
+responses reference them by id.
+"""
+
+
+from mdvpkg.urpmi.packages import RpmEVRD
+
+
+## Version of the protocol spoken by the backends:
+PROTOCOL_VERSION = 2
+
+## urpmi_backend.pl callbacks having a package reference as first
+## argument:
+PACKAGE_CALLBACKS = {'download_start',
+                     'download_progress',
+                     'download_end',
+                     'download_error',
+                     'install_start',
+                     'install_progress',
+                     'install_end',
+                     'remove_start',
+                     'remove_progress',
+                     'remove_end'}
+
+## resolve.pl rejection reasons whose subjects are package references:
+PACKAGE_SUBJECT_REASONS = {'reject-install-conflicts',
+                           'reject-install-rejected-dependency',
+                           'reject-remove-depends'}
+
+
+class ProtocolError(Exception):
+    """Raised for malformed or unexpected backend responses."""
+
+
+def check_version(version):
+    """Raise ProtocolError if a backend speaks another protocol."""
+    if version != str(PROTOCOL_VERSION):
+        raise ProtocolError, 'unsupported backend protocol: %s' % version
+
+
+class PackageTable(object):
+    """Packages defined by a backend process, mapping their ids to
+    (na, evrd) tuples.
+    """
+
+    def __init__(self):
+        self._packages = {}
+
+    def __getitem__(self, id):
+        try:
+            return self._packages[id]
+        except KeyError:
+            raise ProtocolError, 'undefined package id: %s' % id
+
+    def clear(self):
+        """Forget definitions, when the backend is restarted."""
+        self._packages.clear()
+
+    def define(self, id, name, arch, epoch, version, release,
+               distepoch=''):
+        """Handle a package definition response."""
+        evrd = RpmEVRD({'epoch': epoch,
+                        'version': version,
+                        'release': release,
+                        'distepoch': distepoch or None})
+        self._packages[id] = ((name, arch), evrd)
+
+
+def decode_resolution(fields, packages):
+    """Return the tuple of a resolve.pl response fields with package
+    references replaced by (na, evrd) tuples from packages.
+    """
+    tag = fields[0]
+    if tag == 'SELECTED':
+        action, ref = fields[1:3]
+        return (tag, action, packages[ref])
+    elif tag == 'REJECTED':
+        reason, ref = fields[1:3]
+        subjects = fields[3:]
+        if reason in PACKAGE_SUBJECT_REASONS:
+            subjects = [packages[subject] for subject in subjects]
+        return (tag, reason, packages[ref], tuple(subjects))
+    return tuple(fields)
@@ -0,0 +1,254 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Class to control the dependency resolution backend."""
+
+
+import os
+import os.path
+import signal
+import logging
+import subprocess
+import collections
+import gobject
+
+import mdvpkg.exceptions
+from mdvpkg.urpmi import protocol
+
+
+log = logging.getLogger('mdvpkgd.urpmi.resolver')
+
+## Prefix of response lines:
+RESPONSE_PREFIX = '%MDVPKG '
+## Line terminating the responses of a request:
+RESPONSE_END = '%MDVPKG DONE'
+
+
+class UrpmiResolver(object):
+    """Keep a resolve.pl backend running in server mode, so urpmi
+    medias and the depslist are loaded once and kept in memory between
+    resolutions.
+
+    Requests are lines with a command and its tab separated
+    arguments, the backend answers with response lines terminated by
+    RESPONSE_END.  Responses are decoded with the package definitions
+    of the running backend, see mdvpkg.urpmi.protocol.
+    """
+
+    def __init__(self, backend_dir):
+        self._backend_path = os.path.join(backend_dir, 'resolve.pl')
+        self._backend_proc = None
+        self._watches = []
+        self._needs_reload = False
+        self._packages = protocol.PackageTable()
+        # requests waiting to be sent, the one being answered by the
+        # backend, its decoded responses and decoding error:
+        self._queue = collections.deque()
+        self._request = None
+        self._responses = []
+        self._error = None
+        self._buffer = ''
+
+    @property
+    def backend_is_running(self):
+        """True if the resolver backend is running."""
+        if self._backend_proc != None:
+            return self._backend_proc.poll() == None
+        return False
+
+    def start_backend(self):
+        """Starts the backend process."""
+        if self.backend_is_running:
+            raise Exception, 'resolver backend already running'
+        self._backend_proc = subprocess.Popen(
+                                 [self._backend_path, '--server'],
+                                 stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE
+                             )
+        self._buffer = ''
+        self._packages.clear()
+        self._needs_reload = False
+        self._watches = [
+            gobject.io_add_watch(self._backend_proc.stdout,
+                                 gobject.IO_IN | gobject.IO_PRI,
+                                 self._backend_reply_callback),
+            gobject.io_add_watch(self._backend_proc.stdout,
+                                 gobject.IO_ERR | gobject.IO_HUP,
+                                 self._backend_error_callback),
+        ]
+        log.debug('resolver backend started')
+
+    def kill_backend(self):
+        """Send SIGTERM to the backend process and wait its death."""
+        if not self.backend_is_running:
+            raise Exception, 'attempt to kill a not running backend'
+        self._remove_watches()
+        self._backend_proc.send_signal(signal.SIGTERM)
+        self._backend_proc.communicate()
+        self._backend_proc = None
+        log.debug('resolver backend killed')
+
+    def reload(self):
+        """Make the backend reread medias and rpmdb before the next
+        resolution.
+        """
+        self._needs_reload = True
+
+    def resolve(self, args, reply_handler, error_handler,
+                responses=None):
+        """Queue the dependency resolution of args, a list of
+        fullnames to install (or to remove if prefixed by 'r:').
+
+        The call returns immediately, reply_handler is called later
+        from the main loop with the list of decoded responses (see
+        protocol.decode_resolution()), or error_handler with an
+        exception.  If responses is given it's the known answer,
+        replied without asking the backend but still after previously
+        queued requests.
+        """
+        self._queue.append((args, reply_handler, error_handler, responses))
+        if self._request is None:
+            self._send_next_request()
+
+    def _send_next_request(self):
+        """Send the next queued request to the backend."""
+        self._request = None
+        self._responses = []
+        self._error = None
+        while self._queue and self._queue[0][3] is not None:
+            _, reply_handler, _, responses = self._queue.popleft()
+            self._call(reply_handler, responses)
+        if not self._queue:
+            return
+        args, reply_handler, error_handler, _ = self._queue.popleft()
+        try:
+            if not self.backend_is_running:
+                self.start_backend()
+            if self._needs_reload:
+                log.debug('reloading resolver backend')
+                self._write('reload')
+                # the reload request doesn't have handlers:
+                self._queue.appendleft((args,
+                                        reply_handler,
+                                        error_handler,
+                                        None))
+                self._request = (None, None, None, None)
+                self._needs_reload = False
+            else:
+                self._write('resolve', *args)
+                self._request = (args, reply_handler, error_handler, None)
+        except (IOError, OSError) as e:
+            self._call(error_handler,
+                       mdvpkg.exceptions.MdvPkgError(
+                           'resolver backend error: %s' % e
+                       ))
+            self._on_backend_died()
+
+    def _write(self, command, *args):
+        stdin = self._backend_proc.stdin
+        stdin.write('%s\n' % '\t'.join((command,) + tuple(args)))
+        stdin.flush()
+
+    def _call(self, handler, *args):
+        """Call a request handler, logging its failures."""
+        if handler is None:
+            return
+        try:
+            handler(*args)
+        except Exception:
+            log.exception('resolver request handler failed')
+
+    #
+    # Backend I/O callbacks ...
+    #
+
+    def _backend_reply_callback(self, stdout, condition):
+        data = os.read(stdout.fileno(), 65536)
+        if not data:
+            # watches are removed by the handler:
+            self._on_backend_died()
+            return True
+        lines = (self._buffer + data).split('\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            if not line.startswith(RESPONSE_PREFIX):
+                # debug output
+                continue
+            if line == RESPONSE_END:
+                self._on_request_done()
+                continue
+            fields = line[len(RESPONSE_PREFIX):].split('\t')
+            try:
+                if fields[0] == 'PKG':
+                    self._packages.define(*fields[1:])
+                elif fields[0] == 'PROTOCOL':
+                    protocol.check_version(fields[1])
+                elif self._request is None:
+                    log.warning('unexpected resolver output: %s', line)
+                else:
+                    self._responses.append(
+                        protocol.decode_resolution(fields, self._packages)
+                    )
+            except (protocol.ProtocolError, TypeError, ValueError) as e:
+                log.error('bad resolver response: %s: %s', line, e)
+                self._error = e
+        return True
+
+    def _on_request_done(self):
+        """Reply the current request and send the next one."""
+        if self._request is None:
+            log.warning('unexpected end of resolver responses')
+            return
+        _, reply_handler, error_handler, _ = self._request
+        if self._error is not None:
+            self._call(error_handler,
+                       mdvpkg.exceptions.MdvPkgError(
+                           'bad resolver response: %s' % self._error
+                       ))
+        else:
+            self._call(reply_handler, self._responses)
+        self._send_next_request()
+
+    def _backend_error_callback(self, stdout, condition):
+        # watches are removed by the handler:
+        self._on_backend_died()
+        return True
+
+    def _on_backend_died(self):
+        """Fail the current request and clean up the backend, it's
+        restarted by the next request.
+        """
+        log.error('resolver backend exited unexpectedly')
+        self._remove_watches()
+        if self.backend_is_running:
+            self._backend_proc.send_signal(signal.SIGTERM)
+        self._backend_proc = None
+        if self._request is not None:
+            _, _, error_handler, _ = self._request
+            self._call(error_handler,
+                       mdvpkg.exceptions.MdvPkgError(
+                           'resolver backend died'
+                       ))
+        self._send_next_request()
+
+    def _remove_watches(self):
+        while self._watches:
+            gobject.source_remove(self._watches.pop())
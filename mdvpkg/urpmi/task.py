@@ -28,6 +28,9 @@ import collections
 import os.path
 import logging
 import subprocess
+import signal
+
+from mdvpkg.urpmi import protocol
 
 
 log = logging.getLogger('mdvpkgd.urpmi.task')
@@ -50,6 +53,7 @@ class UrpmiRunner(object):
         self._task = None  # (task_id, callback, role, args)
         self._backend_path = os.path.join(backend_dir, 'urpmi_backend.pl')
         self._backend_proc = None
+        self._packages = protocol.PackageTable()
         self._role_handlers = {ROLE_COMMIT: self._handle_commit}
 
     @property
@@ -76,6 +80,7 @@ class UrpmiRunner(object):
                                  stdin=subprocess.PIPE,
                                  stdout=subprocess.PIPE
                              )
+        self._packages.clear()
         gobject.io_add_watch(self._backend_proc.stdout,
                              gobject.IO_IN | gobject.IO_PRI,
                              self._backend_reply_callback)
@@ -146,6 +151,14 @@ class UrpmiRunner(object):
                     except ValueError:
                         name = response[1]
                         args = []
+                    if name in protocol.PACKAGE_CALLBACKS:
+                        try:
+                            args[0] = self._packages[args[0]]
+                        except (IndexError, protocol.ProtocolError) as e:
+                            self._on_backend_exception(
+                                'bad backend response: %s' % e
+                            )
+                            return True
                     args.insert(0, self._task[0])
                     cb_func = getattr(callback, 'on_%s' % name)
                     cb_func(*args)
@@ -176,6 +189,15 @@ class UrpmiRunner(object):
     # Reply callbacks ...
     #
 
+    def _on_backend_protocol(self, version):
+        try:
+            protocol.check_version(version)
+        except protocol.ProtocolError as e:
+            log.error('%s', e)
+
+    def _on_backend_pkg(self, *fields):
+        self._packages.define(*fields)
+
     def _on_backend_done(self):
         task_id, callback = self._task[0:2]
         callback.on_task_done(task_id)
@@ -110,7 +110,7 @@ class Backend(object):
                     'unknown response from backend: %s' % tag
                 )
             else:
-                handler(eval(arg_str))
+                handler(arg_str.split('\t'))
                 if tag != 'SIGNAL':
                     self._clean()
         return True
@@ -0,0 +1,4 @@
+"""mdvpkg tests, run from the source directory with:
+
+    python -m unittest discover -s tests -t .
+"""
@@ -0,0 +1,68 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Package lists running without a bus, for tests and tools/."""
+
+
+import dbus.service
+
+from mdvpkg.daemon import DBusPackageList
+from mdvpkg.urpmi.db import PackageList
+from mdvpkg.urpmi.db import UrpmiDB
+
+
+## Object path of unexported lists:
+LIST_PATH = '/package_list/test'
+
+
+class Connection(object):
+    """Connection keeping the messages sent to it."""
+
+    def __init__(self):
+        self.sent = []
+
+    def _register_object_path(self, *args):
+        pass
+
+    def send_message(self, message):
+        self.sent.append(message)
+
+
+class UnexportedList(DBusPackageList):
+    """DBusPackageList owned by sender, on a Connection instead of a
+    bus.
+    """
+
+    def __init__(self, urpmi, sender):
+        self.test_connection = Connection()
+        dbus.service.Object.__init__(self, self.test_connection, LIST_PATH)
+        PackageList.__init__(self, urpmi)
+        self._sender = sender
+        self._authority = None
+        self.load()
+
+
+def empty_urpmi(tmp_dir):
+    """Return a UrpmiDB without medias and installed packages, with
+    its configuration, data and rpmdb in tmp_dir.
+    """
+    return UrpmiDB(conf_dir=tmp_dir, data_dir=tmp_dir, rpm_dbpath=tmp_dir,
+                   cache_dir=None)
@@ -0,0 +1,121 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Signal connections of lists created and dropped by clients."""
+
+
+import gc
+import time
+import unittest
+
+from mdvpkg import ConnectableObject
+
+
+SIGNALS = ('package-changed', 'install-progress', 'remove-progress')
+## Lists created and dropped by each test:
+LISTS = 10000
+## Emissions timed to measure the cost of emit():
+EMITS = 2000
+
+
+class Listener(object):
+    """Connects its methods to all signals, like PackageList does with
+    the urpmi database.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.calls = 0
+        self.handlers = [source.connect(name, self.on_signal)
+                             for name in SIGNALS]
+
+    def on_signal(self, *args):
+        self.calls += 1
+
+    def delete(self):
+        for handler in self.handlers:
+            self.source.disconnect(handler)
+
+
+class ConnectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = ConnectableObject(SIGNALS)
+        self.listener = Listener(self.source)
+
+    def connections(self):
+        return sum(len(self.source._ConnectableObject__signals[name])
+                       for name in SIGNALS)
+
+    def emit_cost(self):
+        """Return the best time of EMITS emissions, in seconds."""
+        times = []
+        for _ in range(3):
+            start = time.time()
+            for _ in xrange(EMITS):
+                self.source.emit('install-progress', 'task', 1, 2)
+            times.append(time.time() - start)
+        return min(times)
+
+    def churn(self, delete):
+        """Create and drop LISTS listeners, deleting them first if
+        delete is true; return the growth of live objects and the
+        emit() costs before and after.
+        """
+        before = self.emit_cost()
+        gc.collect()
+        objects = len(gc.get_objects())
+        for _ in xrange(LISTS):
+            listener = Listener(self.source)
+            self.source.emit('package-changed', [])
+            if delete:
+                listener.delete()
+            listener = None
+        gc.collect()
+        return len(gc.get_objects()) - objects, before, self.emit_cost()
+
+    def check_churn(self, delete):
+        growth, before, after = self.churn(delete)
+        self.assertEqual(self.connections(), len(SIGNALS))
+        self.assertTrue(growth < LISTS / 100,
+                        '%d objects left by %d lists' % (growth, LISTS))
+        self.assertTrue(after < before * 2 + 0.005,
+                        'emit() went from %.1fms to %.1fms'
+                            % (before * 1e3, after * 1e3))
+        # the remaining listener still gets all signals:
+        self.assertEqual(self.listener.calls, LISTS + 3 * EMITS * 2)
+
+    def test_deleted_lists(self):
+        self.check_churn(delete=True)
+
+    def test_abandoned_lists(self):
+        self.check_churn(delete=False)
+
+    def test_functions_are_kept(self):
+        calls = []
+        self.source.connect('package-changed', lambda *a: calls.append(a))
+        gc.collect()
+        self.source.emit('package-changed', ['na'])
+        self.assertEqual(calls, [(['na'],)])
+
+
+if __name__ == '__main__':
+    unittest.main()
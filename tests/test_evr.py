@@ -0,0 +1,201 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Ordering of version_key() and evrd_key() against rpm's."""
+
+
+import itertools
+import unittest
+
+from mdvpkg.urpmi.packages import RpmEVRD
+from mdvpkg.urpmi.packages import version_key
+
+try:
+    import rpm
+except ImportError:
+    rpm = None
+
+
+## Versions compared two by two, covering leading zeros, tildes,
+## separators and alphabetic against numeric segments ...
+VERSIONS = ('0', '00', '1', '01', '001', '1.0', '1.00', '1.01', '1.1',
+            '1.001', '1.2', '1.10', '1.9', '10', '2', '1a', '1.a', '1b',
+            '1.0a', '1.0.a', 'a', 'A', 'b', 'abc', 'abd', 'ab1', 'ab.1',
+            '1.0~rc1', '1.0~rc2', '1.0~~', '1.0~', '1.0~1', '~', '~1',
+            '1.0.', '1.0_1', '1.0-', '2.6.33.7', '2.6.33.10', '2.6.33',
+            '2011.0', '2010.2', '20110101', '1.0.0', '1.0.0.0')
+
+## (lesser, greater) EVRDs as (epoch, version, release, distepoch):
+ORDERED = [
+    # epoch comes first, a missing epoch is 0
+    ((0, '2', '1', None), (1, '1', '1', None)),
+    ((None, '9', '9', None), (1, '0', '0', None)),
+    ((1, '2', '1', None), (2, '1', '1', None)),
+    # then version and release
+    ((0, '1.9', '1', None), (0, '1.10', '1', None)),
+    ((0, '1.0', '9', None), (0, '1.1', '1', None)),
+    ((0, '1.0', '1', None), (0, '1.0', '1mdv', None)),
+    ((0, '1.0', '1mdv', None), (0, '1.0', '2mdv', None)),
+    ((0, '1.0~rc1', '1', None), (0, '1.0', '1', None)),
+    ((0, '1.0', '0.rc1.1', None), (0, '1.0', '1', None)),
+    # distepoch is compared last, a missing one sorts as empty
+    ((0, '1.0', '1', '2010.2'), (0, '1.0', '1', '2011.0')),
+    ((0, '1.0', '1', None), (0, '1.0', '1', '2011.0')),
+    ((0, '1.0', '1', '2011.0'), (0, '1.0', '2', '2010.2')),
+    ((0, '1.0', '1', '2011.0'), (1, '0.1', '1', '2010.0')),
+]
+
+## EVRDs of the same order:
+EQUAL = [
+    ((None, '1.0', '1', None), (0, '1.0', '1', None)),
+    ((0, '1.01', '1', None), (0, '1.1', '1', None)),
+    ((0, '001', '01', None), (0, '1', '1', None)),
+    ((0, '1.0a', '1', None), (0, '1.0.a', '1', None)),
+    ((0, '1_0', '1', None), (0, '1.0', '1', None)),
+    ((0, '1.0', '1', None), (0, '1.0', '1', '')),
+]
+
+
+def rpmvercmp(a, b):
+    """Compare version strings as librpm's rpmvercmp() does."""
+    if a == b:
+        return 0
+    i = j = 0
+    while i < len(a) or j < len(b):
+        while i < len(a) and not a[i].isalnum() and a[i] != '~':
+            i += 1
+        while j < len(b) and not b[j].isalnum() and b[j] != '~':
+            j += 1
+        # a tilde sorts before everything else, even the end:
+        a_tilde = i < len(a) and a[i] == '~'
+        b_tilde = j < len(b) and b[j] == '~'
+        if a_tilde or b_tilde:
+            if not a_tilde:
+                return 1
+            if not b_tilde:
+                return -1
+            i += 1
+            j += 1
+            continue
+        if i == len(a) or j == len(b):
+            break
+        if a[i].isdigit():
+            end_a, end_b = _run(a, i, str.isdigit), _run(b, j, str.isdigit)
+            numeric = True
+        else:
+            end_a, end_b = _run(a, i, str.isalpha), _run(b, j, str.isalpha)
+            numeric = False
+        if end_b == j:
+            # segments of different kinds, numeric ones are newer:
+            return numeric and 1 or -1
+        seg_a, seg_b = a[i:end_a], b[j:end_b]
+        if numeric:
+            seg_a, seg_b = seg_a.lstrip('0'), seg_b.lstrip('0')
+            if len(seg_a) != len(seg_b):
+                return cmp(len(seg_a), len(seg_b))
+        result = cmp(seg_a, seg_b)
+        if result:
+            return result
+        i, j = end_a, end_b
+    if i == len(a) and j == len(b):
+        return 0
+    return i == len(a) and -1 or 1
+
+
+def _run(string, start, predicate):
+    end = start
+    while end < len(string) and predicate(string[end]):
+        end += 1
+    return end
+
+
+def evrd(values):
+    epoch, version, release, distepoch = values
+    return RpmEVRD.from_values(epoch, version, release, distepoch)
+
+
+def sign(value):
+    return cmp(value, 0)
+
+
+class VersionKeyTest(unittest.TestCase):
+
+    def test_rpmvercmp(self):
+        for a, b in itertools.product(VERSIONS, repeat=2):
+            self.assertEqual(cmp(version_key(a), version_key(b)),
+                             rpmvercmp(a, b),
+                             'version_key() orders %r and %r wrong'
+                                 % (a, b))
+
+    def test_ordered(self):
+        for lesser, greater in ORDERED:
+            self.assertTrue(evrd(lesser) < evrd(greater),
+                            '%r < %r' % (lesser, greater))
+            self.assertTrue(evrd(greater) > evrd(lesser),
+                            '%r > %r' % (greater, lesser))
+
+    def test_equal(self):
+        for a, b in EQUAL:
+            self.assertEqual(cmp(evrd(a), evrd(b)), 0,
+                             '%r == %r' % (a, b))
+
+    def test_sort_is_total(self):
+        evrds = [evrd((epoch, version, release, None))
+                     for epoch in (None, 1)
+                     for version in VERSIONS
+                     for release in ('1', '1mdv', '0.rc1.1')]
+        keys = [e.key for e in sorted(evrds)]
+        self.assertEqual(keys, sorted(keys))
+
+
+class RpmCompareTest(unittest.TestCase):
+    """Compare with the rpm bindings the daemon used to order EVRDs
+    with, when they're available.
+    """
+
+    def setUp(self):
+        if rpm is None or not hasattr(rpm, 'evrCompare'):
+            self.skipTest('rpm bindings with evrCompare() not available')
+        if rpm.evrCompare('0:1.10-1', '0:1.9-1') <= 0:
+            self.skipTest('rpm bindings evrCompare() is not rpm\'s')
+
+    def assertSameOrder(self, a, b):
+        a, b = evrd(a), evrd(b)
+        self.assertEqual(sign(cmp(a, b)),
+                         sign(rpm.evrCompare(repr(a), repr(b))),
+                         '%r and %r ordered unlike rpm' % (a, b))
+
+    def test_versions(self):
+        for a, b in itertools.product(VERSIONS, repeat=2):
+            self.assertSameOrder((0, a, '1', None), (0, b, '1', None))
+            self.assertSameOrder((0, '1', a, None), (0, '1', b, None))
+
+    def test_epochs_and_distepochs(self):
+        # rpm only compares distepochs both EVRDs have, so keep pairs
+        # with a missing one out:
+        for a, b in ORDERED + EQUAL:
+            if (a[3] is None) == (b[3] is None):
+                self.assertSameOrder(a, b)
+                self.assertSameOrder(b, a)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Latency of concurrent resolutions with a fake resolver backend."""
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+import gobject
+
+from mdvpkg.urpmi.resolver import UrpmiResolver
+
+
+## Seconds the fake backend takes to answer each resolution:
+BACKEND_DELAY = 0.2
+## Clients and calls per client fired at once:
+CLIENTS = 4
+CALLS = 3
+## Main loop tick used to measure how long it's blocked, in ms:
+TICK = 20
+
+FAKE_BACKEND = """#!%(python)s
+import sys, time
+out = sys.stdout
+out.write('%%MDVPKG PROTOCOL\\t2\\n')
+out.flush()
+for line in iter(sys.stdin.readline, ''):
+    if line.startswith('resolve\\t'):
+        time.sleep(%(delay)s)
+    out.write('%%MDVPKG DONE\\n')
+    out.flush()
+"""
+
+
+class ResolverLatencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend_dir = tempfile.mkdtemp()
+        path = os.path.join(self.backend_dir, 'resolve.pl')
+        with open(path, 'w') as backend:
+            backend.write(FAKE_BACKEND % {'python': sys.executable,
+                                          'delay': BACKEND_DELAY})
+        os.chmod(path, 0755)
+        self.resolver = UrpmiResolver(self.backend_dir)
+
+    def tearDown(self):
+        if self.resolver.backend_is_running:
+            self.resolver.kill_backend()
+        shutil.rmtree(self.backend_dir)
+
+    def test_concurrent_clients(self):
+        loop = gobject.MainLoop()
+        replies = dict((client, []) for client in range(CLIENTS))
+        errors = []
+        ticks = [time.time()]
+        gaps = []
+        expected = CLIENTS * CALLS
+
+        def tick():
+            now = time.time()
+            gaps.append(now - ticks[-1])
+            ticks.append(now)
+            return True
+
+        def reply_handler(client, call, sent):
+            def on_reply(responses):
+                replies[client].append((call, time.time() - sent))
+                if sum(map(len, replies.values())) == expected:
+                    loop.quit()
+            return on_reply
+
+        def error_handler(error):
+            errors.append(error)
+            loop.quit()
+
+        start = time.time()
+        for call in range(CALLS):
+            for client in range(CLIENTS):
+                self.resolver.resolve(['client%d-call%d' % (client, call)],
+                                      reply_handler(client, call,
+                                                    time.time()),
+                                      error_handler)
+        # queuing must not wait for the backend:
+        self.assertTrue(time.time() - start < BACKEND_DELAY)
+        tick_source = gobject.timeout_add(TICK, tick)
+        gobject.timeout_add(int(expected * BACKEND_DELAY * 5000),
+                            loop.quit)
+        loop.run()
+        gobject.source_remove(tick_source)
+
+        self.assertEqual(errors, [])
+        for client, calls in replies.iteritems():
+            self.assertEqual([call for call, _ in calls], range(CALLS))
+        # the main loop kept running while the backend was busy:
+        self.assertTrue(len(gaps) > expected)
+        self.assertTrue(max(gaps) < BACKEND_DELAY / 2,
+                        'main loop blocked for %.3fs' % max(gaps))
+        # resolutions are serialized by the backend, a call waits at
+        # most for the ones queued before it:
+        latencies = [latency for calls in replies.values()
+                             for _, latency in calls]
+        self.assertTrue(max(latencies) < (expected + 2) * BACKEND_DELAY)
+
+
+if __name__ == '__main__':
+    unittest.main()
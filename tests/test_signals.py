@@ -0,0 +1,90 @@
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Package list signals sent only to the list owner."""
+
+
+import shutil
+import tempfile
+import unittest
+
+import dbus.service
+
+import mdvpkg
+from mdvpkg.daemon import DBusPackageList
+from mdvpkg.urpmi.packages import RpmPackage
+from tests.fakes import LIST_PATH
+from tests.fakes import UnexportedList
+from tests.fakes import empty_urpmi
+
+
+OWNER = ':1.42'
+
+
+class DirectedSignalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.urpmi = empty_urpmi(self.tmp)
+        for name in ('bash', 'zsh'):
+            record = (name, '1.0', '1mdv', 'x86_64', 0, 1024, 'Shells',
+                      'summary of %s' % name, 'mdv', '2011.0')
+            self.urpmi._on_package(RpmPackage.from_record(record,
+                                                          media='main'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_sent_to_owner(self):
+        package_list = UnexportedList(self.urpmi, OWNER)
+        package_list.sort('name')
+        package_list.Get(1, ['summary'], OWNER)
+        package_list.Ready()
+        sent = package_list.test_connection.sent
+        self.assertEqual([message.get_member() for message in sent],
+                         ['Package', 'Ready'])
+        for message in sent:
+            self.assertEqual(message.get_destination(), OWNER)
+            self.assertEqual(message.get_path(), LIST_PATH)
+            self.assertEqual(message.get_interface(),
+                             mdvpkg.PACKAGE_LIST_IFACE)
+        self.assertEqual(sent[0].get_args_list()[:3], [1, 'zsh', 'x86_64'])
+
+    def test_broadcast_without_owner(self):
+        package_list = UnexportedList(self.urpmi, None)
+        package_list.Ready()
+        sent = package_list.test_connection.sent
+        self.assertEqual([message.get_member() for message in sent],
+                         ['Ready'])
+        self.assertEqual(sent[0].get_destination(), None)
+
+    def test_introspection(self):
+        @dbus.service.signal(dbus_interface=mdvpkg.PACKAGE_LIST_IFACE,
+                             signature='')
+        def Ready(self):
+            pass
+        self.assertEqual(sorted(DBusPackageList.Ready.im_func.__dict__),
+                         sorted(Ready.__dict__))
+        self.assertEqual(DBusPackageList.Ready.__name__, 'Ready')
+
+
+if __name__ == '__main__':
+    unittest.main()
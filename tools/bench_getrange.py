@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Daemon time to send the rows of a package list.
+
+Compares one GetRange() call with one Get() call per row, on a list
+of synthetic packages.  The list is not exported on a bus, see
+tests/fakes.py: Package signals are built and handed to a connection
+that keeps them, so only the daemon side is measured, not the bus
+round trips Get() adds.  Run from the source directory:
+
+    python tools/bench_getrange.py [-p PACKAGES]
+"""
+
+
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+sys.path.insert(0, '.')
+from mdvpkg.urpmi.packages import RpmPackage
+from tests.fakes import UnexportedList
+from tests.fakes import empty_urpmi
+
+
+SENDER = ':1.42'
+ATTRIBUTES = ['size', 'summary', 'progress', 'media', 'version']
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-p', '--packages', type='int', default=20000,
+                      help='packages in the list')
+    options, _ = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        urpmi = empty_urpmi(tmp)
+        for i in xrange(options.packages):
+            record = ('package%d' % i, '1.%d' % (i % 50), '1mdv',
+                      'x86_64', 0, i * 1024, 'System/Libraries',
+                      'summary of package %d' % i, 'mdv', '2011.0')
+            installtime = i % 3 == 0 and 1300000000 or None
+            urpmi._on_package(RpmPackage.from_record(
+                                  record,
+                                  media=not installtime and 'main' or None,
+                                  installtime=installtime
+                              ))
+        package_list = UnexportedList(urpmi, SENDER)
+        package_list.sort('name')
+        count = len(package_list)
+
+        start = time.time()
+        package_list.GetRange(0, count, ATTRIBUTES, SENDER)
+        get_range = time.time() - start
+        start = time.time()
+        for index in xrange(count):
+            package_list.Get(index, ATTRIBUTES, SENDER)
+        gets = time.time() - start
+    finally:
+        shutil.rmtree(tmp)
+
+    print '%d rows of %s' % (count, ', '.join(ATTRIBUTES))
+    print 'GetRange() %8.1f ms, 1 call' % (get_range * 1e3)
+    print 'Get()      %8.1f ms, %d calls and signals' % (gets * 1e3, count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Decoding time of backend progress responses.
+
+Compares the package id protocol with the python literals backends
+sent before it, which were eval()'d and turned into a RpmEVRD for each
+response.  Run from the source directory:
+
+    python tools/bench_protocol.py [-p PACKAGES] [-r RESPONSES]
+"""
+
+
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, '.')
+from mdvpkg.urpmi import protocol
+from mdvpkg.urpmi.packages import create_evrd
+
+
+def package_fields(i):
+    """Return name, arch, epoch, version, release and distepoch of a
+    synthetic package.
+    """
+    return ('package%d' % i, 'x86_64', '0', '1.%d' % i, '1', '2011.0')
+
+
+def literal_line(fields, percent):
+    """Return a progress response of the literal protocol."""
+    name, arch, epoch, version, release, distepoch = fields
+    ref = ("(('%s', '%s'), {'epoch': %s, 'version': '%s',"
+           " 'release': '%s', 'distepoch': '%s'})"
+               % (name, arch, epoch, version, release, distepoch))
+    return '<mdvpkg> callback\tinstall_progress\t%s\t%d\t100\n' \
+               % (ref, percent)
+
+
+def id_line(id, percent):
+    """Return a progress response of the package id protocol."""
+    return '<mdvpkg> callback\tinstall_progress\t%s\t%d\t100\n' \
+               % (id, percent)
+
+
+def split_callback(line):
+    """Split a callback response as UrpmiRunner does."""
+    _, line = line.split(' ', 1)
+    response = line.rstrip('\n').split('\t', 1)
+    name, args = response[1].split('\t', 1)
+    return name, args.split('\t')
+
+
+def decode_literal(lines):
+    for line in lines:
+        name, args = split_callback(line)
+        na, evrd = eval(args[0])
+        args[0] = (na, create_evrd(evrd))
+
+
+def decode_ids(lines, packages):
+    for line in lines:
+        name, args = split_callback(line)
+        args[0] = packages[args[0]]
+
+
+def best_time(func, *args):
+    times = []
+    for _ in range(3):
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-p', '--packages', type='int', default=500,
+                      help='packages in the transaction')
+    parser.add_option('-r', '--responses', type='int', default=50000,
+                      help='progress responses decoded')
+    options, _ = parser.parse_args()
+
+    packages = [package_fields(i) for i in range(options.packages)]
+    table = protocol.PackageTable()
+    for i, fields in enumerate(packages):
+        table.define(str(i), *fields)
+    responses = [i % options.packages for i in range(options.responses)]
+    literal_lines = [literal_line(packages[i], n % 100)
+                         for n, i in enumerate(responses)]
+    id_lines = [id_line(i, n % 100) for n, i in enumerate(responses)]
+
+    literal = best_time(decode_literal, literal_lines)
+    ids = best_time(decode_ids, id_lines, table)
+    for title, seconds in (('literal', literal), ('package id', ids)):
+        print '%-10s %8.1f ms %6.2f us/response' \
+                  % (title, seconds * 1e3, seconds / len(responses) * 1e6)
+    print 'speedup    %8.1fx' % (literal / ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Reading time of installed packages from rpmdb.
+
+Compares the scan UrpmiDB does, with header digest checks disabled and
+tags read by a single header.sprintf(), with the previous scan reading
+each tag by a header lookup.  Also times how rpmdb changes are found:
+listing header instances from the name index, against walking all
+headers when the bindings can't read indexes.  Needs the rpm bindings
+and reads the system rpmdb, or another one given by its path.  Run
+from the source directory:
+
+    python tools/bench_rpmdb.py [-d DBPATH]
+"""
+
+
+import sys
+import time
+from optparse import OptionParser
+
+import rpm
+
+sys.path.insert(0, '.')
+from mdvpkg.urpmi import db
+from mdvpkg.urpmi.packages import RpmPackage
+
+
+## Tags read one by one by the previous scan:
+LOOKUP_TAGS = ('name', 'version', 'release', 'arch', 'epoch', 'size',
+               'group', 'summary', 'installtime', 'disttag', 'distepoch')
+
+
+def scan_lookups():
+    """Read rpmdb as UrpmiDB did before bulk tag reads."""
+    packages = []
+    for header in rpm.ts().dbMatch():
+        pkgdict = {}
+        for tag in LOOKUP_TAGS:
+            value = header[tag]
+            if type(value) is list and len(value) == 0:
+                value = ''
+            pkgdict[tag] = value
+        if type(header['installtime']) is list:
+            pkgdict['installtime'] = header['installtime'][0]
+        if pkgdict['epoch'] is None:
+            pkgdict['epoch'] = 0
+        packages.append(RpmPackage(pkgdict))
+    return packages
+
+
+def scan_sprintf():
+    """Read rpmdb as UrpmiDB does."""
+    read_header = db.UrpmiDB._read_rpmdb_header.im_func
+    ts = rpm.ts()
+    ts.setVSFlags(db.RPMDB_VSFLAGS)
+    return [read_header(None, header) for header in ts.dbMatch()]
+
+
+def list_indexed():
+    """List header instances as UrpmiDB does on rpmdb changes."""
+    instances = db.UrpmiDB._rpmdb_instances.im_func(Reader())
+    if instances is None:
+        return ()
+    return instances
+
+
+def list_walked():
+    """List header instances walking all headers, as UrpmiDB does
+    if the bindings can't read indexes.
+    """
+    return [instance for instance, _
+                in db.UrpmiDB._match_rpmdb.im_func(Reader())]
+
+
+class Reader(object):
+    """Stands for the UrpmiDB reading rpmdb, the dbpath macro is set
+    by main().
+    """
+    _rpm_dbpath = None
+
+
+def best_time(func):
+    times = []
+    for _ in range(3):
+        start = time.time()
+        count = len(func())
+        times.append(time.time() - start)
+    return min(times), count
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-d', '--dbpath',
+                      help='rpmdb directory, the system one by default')
+    options, _ = parser.parse_args()
+
+    if options.dbpath is not None:
+        rpm.addMacro('_dbpath', options.dbpath)
+    lookups, count = best_time(scan_lookups)
+    sprintf, _ = best_time(scan_sprintf)
+    print '%d installed packages' % count
+    for title, seconds in (('lookups', lookups), ('sprintf', sprintf)):
+        print '%-8s %8.1f ms %7.1f us/package' \
+                  % (title, seconds * 1e3, seconds / max(count, 1) * 1e6)
+    if sprintf:
+        print 'speedup  %8.1fx' % (lookups / sprintf)
+    print 'finding changes:'
+    if not hasattr(rpm.ts(), 'dbIndex'):
+        print 'rpm bindings without dbIndex(), changes walk all headers'
+    else:
+        indexed, _ = best_time(list_indexed)
+        print '%-8s %8.1f ms' % ('index', indexed * 1e3)
+    walked, _ = best_time(list_walked)
+    print '%-8s %8.1f ms' % ('walk', walked * 1e3)
+
+
+if __name__ == '__main__':
+    main()
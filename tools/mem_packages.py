@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+##
+## Copyright (C) 2010-2011 Mandriva S.A <http://www.mandriva.com>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU Lesser General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+##
+## Author(s): J. Victor Martins <jvdm@mandriva.com>
+##
+"""Resident memory of RpmPackage objects, per 10k packages.
+
+Packages are built from synthetic media records whose strings are all
+distinct objects, as they are when parsed from synthesis files, so
+shared fields only cost once if they're interned.  Run from the source
+directory:
+
+    python tools/mem_packages.py [-p PACKAGES]
+"""
+
+
+import sys
+import resource
+from optparse import OptionParser
+
+sys.path.insert(0, '.')
+from mdvpkg.urpmi.packages import RpmPackage
+
+
+GROUPS = ('System/Libraries', 'Development/C', 'Graphical desktop/KDE')
+
+
+def fresh(string):
+    """Return a copy of string that's not the same object."""
+    return ''.join(list(string))
+
+
+def record(i):
+    """Return the media record of a synthetic package."""
+    return ('package%d' % i,
+            '1.%d' % (i % 50),
+            '%dmdv2011.0' % (i % 7),
+            fresh('x86_64'),
+            str(i % 3),
+            str(i * 1024),
+            fresh(GROUPS[i % len(GROUPS)]),
+            'summary of package %d' % i,
+            fresh('mdv'),
+            fresh('2011.0'))
+
+
+def rss():
+    """Return the peak resident size of the process, in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-p', '--packages', type='int', default=100000,
+                      help='packages built')
+    options, _ = parser.parse_args()
+
+    base = rss()
+    packages = [RpmPackage.from_record(record(i), media=fresh('main'))
+                    for i in xrange(options.packages)]
+    growth = rss() - base
+    print '%d packages: %d KiB, %.1f MiB per 10k packages' \
+              % (len(packages), growth,
+                 growth * 10000.0 / len(packages) / 1024)
+
+
+if __name__ == '__main__':
+    main()